@@ -5,16 +5,20 @@ Handles complete conversation flow from search to booking
 """
 import os
 from dotenv import load_dotenv
+
+# Load environment variables before the project modules below read their settings at import
+load_dotenv()
+
 from langchain_groq import ChatGroq
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.prompts import PromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 
 from tools import (
     search_trains,
+    search_trains_flexible,
+    search_trains_by_city,
     get_available_trains,
     get_cheapest_trains,
     get_fastest_trains,
@@ -34,11 +38,11 @@ from tools import (
     submit_signin_otp,
     reset_browser,
     close_browser,
-    get_city_stations
+    get_city_stations,
+    set_session_id
 )
-
-# Load environment variables
-load_dotenv()
+import intent_router
+from chat_history import chat_sessions
 
 # Initialize LLM - Choose one option below:
 
@@ -62,6 +66,8 @@ llm = ChatGroq(
 # Define all available tools
 tools = [
     search_trains,
+    search_trains_flexible,
+    search_trains_by_city,
     get_available_trains,
     get_cheapest_trains,
     get_fastest_trains,
@@ -94,7 +100,7 @@ IMPORTANT GUIDELINES:
 1. Always be polite, complete and comprehensive
 2. When searching trains, ask for source, destination, and date if not provided
 3. Use standard station codes (e.g., NDLS for New Delhi, BCT for Mumbai Central)
-4. **IMPORTANT**: When user mentions a city name (like "Delhi", "Mumbai", "Bangalore") instead of station code, ALWAYS use the get_city_stations tool to show them all available stations in that city
+4. **IMPORTANT**: When user mentions a city name (like "Delhi", "Mumbai", "Bangalore") instead of station code, ALWAYS use the get_city_stations tool to show them all available stations in that city. If they don't mind which station, use search_trains_by_city to search all main stations at once
 5. When showing results from Action: get_available_trains, for each train always display:
 - Train name and number
 - Departure and arrival times
@@ -152,7 +158,7 @@ TRAIN CLASSES:
 
 CONVERSATION FLOW:
 1. Greet and understand user's travel needs
-2. Search trains using search_trains tool
+2. Search trains using search_trains tool (use search_trains_flexible when the date is approximate, e.g. "around the 25th")
 3. Show available options using get_available_trains
 4. Apply filters if requested (cheapest, fastest, by class)
 5. Show detailed train info when user selects
@@ -226,24 +232,9 @@ agent_executor = AgentExecutor(
     early_stopping_method="force"  # Force completion even if agent gets stuck
 )
 
-# Store for chat histories (in production, use Redis or DB)
-chat_histories = {}
-
 def get_chat_history(session_id: str) -> str:
-    """Get or create chat history for a session"""
-    if session_id not in chat_histories:
-        chat_histories[session_id] = ChatMessageHistory()
-    
-    history = chat_histories[session_id]
-    if not history.messages:
-        return ""
-    
-    # Format history for the prompt
-    formatted = []
-    for msg in history.messages:
-        role = "Human" if isinstance(msg, HumanMessage) else "AI"
-        formatted.append(f"{role}: {msg.content}")
-    return "\n".join(formatted)
+    """Chat history for a session formatted for the prompt, trimmed to its token budget"""
+    return chat_sessions.render(session_id)
 
 def chat(message: str, session_id: str = "default") -> dict:
     """
@@ -257,27 +248,32 @@ def chat(message: str, session_id: str = "default") -> dict:
         dict with response and metadata
     """
     try:
-        # Get chat history
-        history = get_chat_history(session_id)
+        # Scope tool calls (and the backend's search results) to this session
+        set_session_id(session_id)
         
-        # Run the agent
-        response = agent_executor.invoke({
-            "input": message,
-            "chat_history": history
-        })
+        # Structured follow-ups on a cached search skip the LLM
+        output = intent_router.route(message, chat_sessions.last_reply(session_id))
         
-        # Extract output
-        output = response.get("output", "")
+        if output is None:
+            # Get chat history
+            history = get_chat_history(session_id)
+            
+            # Run the agent
+            response = agent_executor.invoke({
+                "input": message,
+                "chat_history": history
+            })
+            
+            # Extract output
+            output = response.get("output", "")
         
         # If no output, return error
         if not output or output.strip() == "":
             output = "I apologize, but I couldn't generate a proper response. Could you please rephrase your question?"
         
         # Save to history
-        if session_id not in chat_histories:
-            chat_histories[session_id] = ChatMessageHistory()
-        chat_histories[session_id].add_user_message(message)
-        chat_histories[session_id].add_ai_message(output)
+        chat_sessions.add_user_message(session_id, message)
+        chat_sessions.add_ai_message(session_id, output)
         
         return {
             "success": True,
@@ -304,8 +300,7 @@ def chat(message: str, session_id: str = "default") -> dict:
 
 def clear_history(session_id: str = "default"):
     """Clear chat history for a session"""
-    if session_id in chat_histories:
-        del chat_histories[session_id]
+    if chat_sessions.clear(session_id):
         return {"success": True, "message": f"History cleared for session {session_id}"}
     return {"success": False, "message": "Session not found"}
 
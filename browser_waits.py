@@ -0,0 +1,79 @@
+"""
+Condition-based waits for driving the Disha UI
+Each step waits for the DOM condition it actually needs (with a per-step timeout) instead of
+sleeping a fixed time, so flows run as fast as the page renders
+"""
+import os
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
+
+# Default seconds a step may wait for its condition
+BROWSER_STEP_TIMEOUT = float(os.getenv("BROWSER_STEP_TIMEOUT", "15"))
+# Seconds to look for UI that only sometimes appears (confirm dialogs, IRCTC id prompt)
+BROWSER_OPTIONAL_TIMEOUT = float(os.getenv("BROWSER_OPTIONAL_TIMEOUT", "3"))
+# How often conditions are re-checked (seconds)
+BROWSER_POLL_INTERVAL = float(os.getenv("BROWSER_POLL_INTERVAL", "0.1"))
+
+# Steps that legitimately take longer than the default; BROWSER_TIMEOUT_<STEP> overrides any step
+STEP_TIMEOUTS = {
+    "train_card": 20,
+}
+
+
+def step_timeout(step):
+    override = os.getenv(f"BROWSER_TIMEOUT_{step.upper()}")
+    if override:
+        return float(override)
+    return STEP_TIMEOUTS.get(step, BROWSER_STEP_TIMEOUT)
+
+
+def wait_for(driver, condition, step, timeout=None):
+    """
+    Wait until condition(driver) returns something truthy and return it.
+    Raises TimeoutException naming the step.
+    """
+    timeout = step_timeout(step) if timeout is None else timeout
+    try:
+        return WebDriverWait(
+            driver, timeout, poll_frequency=BROWSER_POLL_INTERVAL,
+            ignored_exceptions=(StaleElementReferenceException,)
+        ).until(condition)
+    except TimeoutException:
+        raise TimeoutException(f"Timed out after {timeout}s waiting for {step.replace('_', ' ')}")
+
+
+def wait_optional(driver, condition, step, timeout=BROWSER_OPTIONAL_TIMEOUT):
+    """Like wait_for, but returns None when the condition doesn't hold in time"""
+    try:
+        return wait_for(driver, condition, step, timeout=timeout)
+    except TimeoutException:
+        return None
+
+
+def wait_present(driver, locator, step, timeout=None):
+    return wait_for(driver, EC.presence_of_element_located(locator), step, timeout)
+
+
+def wait_clickable(driver, locator, step, timeout=None):
+    """Visible and enabled"""
+    return wait_for(driver, EC.element_to_be_clickable(locator), step, timeout)
+
+
+def click(driver, locator, step, timeout=None):
+    element = wait_clickable(driver, locator, step, timeout)
+    element.click()
+    return element
+
+
+def wait_count_below(driver, locator, count, step, timeout=None):
+    """Wait until fewer than count elements match, e.g. after deleting a list item"""
+    return wait_for(driver, lambda d: len(d.find_elements(*locator)) < count, step, timeout)
+
+
+def value_is(locator, value):
+    """Condition: the first matching input's value equals value, e.g. a form reset to empty"""
+    def condition(d):
+        elements = d.find_elements(*locator)
+        return elements[0] if elements and elements[0].get_attribute('value') == value else False
+    return condition
@@ -0,0 +1,185 @@
+"""
+Chat history for the agent prompt
+Each session keeps its recent messages verbatim within a token budget; older turns are condensed
+into one line per request, with the trains offered in reply, and eventually dropped. Idle
+sessions are evicted, least recently used first, so memory stays bounded however many users
+come and go.
+"""
+import os
+import re
+import time
+from collections import deque
+from session_store import SessionStore
+
+# Estimated tokens of verbatim messages kept per session, and of condensed older turns
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "300"))
+# Sessions idle for longer than this (seconds) are evicted
+CHAT_SESSION_IDLE_TTL = float(os.getenv("CHAT_SESSION_IDLE_TTL", "3600"))
+MAX_CHAT_SESSIONS = int(os.getenv("MAX_CHAT_SESSIONS", "500"))
+# Longer messages are truncated before they are stored
+CHAT_MESSAGE_MAX_CHARS = int(os.getenv("CHAT_MESSAGE_MAX_CHARS", "4000"))
+
+HUMAN = "Human"
+AI = "AI"
+# Characters of a condensed user request kept in the summary, and of an answer without trains
+_SUMMARY_CHARS = 160
+_SUMMARY_ANSWER_CHARS = 80
+# Train numbers kept from a condensed answer
+_SUMMARY_TRAINS = 10
+_TRAIN_NUMBER = re.compile(r"\b\d{5}\b")
+
+
+def _condense(turn):
+    """One summary line for a dropped turn: the request, and the trains offered in reply"""
+    request = " ".join(line[len(HUMAN) + 2:] for role, line in turn if role == HUMAN)
+    answer = " ".join(line[len(AI) + 2:] for role, line in turn if role == AI)
+    summary_line = f"- {' '.join(request.split())[:_SUMMARY_CHARS] or '(no request)'}"
+    # Answers are mostly tool listings the agent can fetch again; the train numbers it offered are
+    # what later messages ("book the second one") refer back to
+    trains = list(dict.fromkeys(_TRAIN_NUMBER.findall(answer)))
+    if trains:
+        return f"{summary_line} -> offered {', '.join(trains[:_SUMMARY_TRAINS])}"
+    if answer:
+        return f"{summary_line} -> {' '.join(answer.split())[:_SUMMARY_ANSWER_CHARS]}"
+    return summary_line
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English), no tokenizer needed"""
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    """
+    Messages are kept already rendered: transcript is updated as messages are appended or
+    trimmed, so preparing the prompt never walks the whole history
+    """
+
+    def __init__(self):
+        self.messages = deque()  # (role, rendered line, tokens), oldest first
+        self.transcript = ""  # The lines in messages joined by newlines
+        self.tokens = 0
+        self.summary = deque()  # (line, tokens) per condensed turn, oldest first
+        self.summary_text = ""
+        self.summary_tokens = 0
+        self.condensed = 0
+        self.last_seen = time.time()
+
+
+class ChatSessions(SessionStore):
+    """Chat histories keyed by session id, with per-session token budgets and idle eviction"""
+
+    def __init__(self, token_budget, summary_budget, idle_ttl, max_sessions):
+        super().__init__(ChatSession, idle_ttl, max_sessions)
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+
+    def add_user_message(self, session_id, content):
+        self._add(session_id, HUMAN, content)
+
+    def add_ai_message(self, session_id, content):
+        self._add(session_id, AI, content)
+
+    def render(self, session_id):
+        """The session's history as a "Human:/AI:" transcript for the prompt, empty if none"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return ""
+            self._touch(session_id)
+            if session.summary_text:
+                return f"{session.summary_text}\n{session.transcript}"
+            return session.transcript
+
+    def last_reply(self, session_id):
+        """The agent's most recent message in the session, None if there isn't one"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            for role, line, _ in reversed(session.messages):
+                if role == AI:
+                    return line[len(AI) + 2:]
+            return None
+
+    def clear(self, session_id):
+        """Forget a session; False if it didn't exist"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _add(self, session_id, role, content):
+        with self._lock:
+            session = self._touch(session_id)
+            if len(content) > CHAT_MESSAGE_MAX_CHARS:
+                content = content[:CHAT_MESSAGE_MAX_CHARS] + " ..."
+            line = f"{role}: {content}"
+            tokens = estimate_tokens(line)
+            session.messages.append((role, line, tokens))
+            session.transcript = f"{session.transcript}\n{line}" if session.transcript else line
+            session.tokens += tokens
+            self._compact(session)
+            self._sweep()
+
+    def _compact(self, session):
+        condensed = False
+        while session.tokens > self.token_budget:
+            # Drop whole turns (a request and the answers to it) so the window never opens on an
+            # answer; the latest turn is always kept verbatim, even if it alone exceeds the budget
+            end = 1
+            while end < len(session.messages) and session.messages[end][0] != HUMAN:
+                end += 1
+            if end == len(session.messages):
+                break
+            turn = [self._pop(session) for _ in range(end)]
+            summary_line = _condense(turn)
+            summary_tokens = estimate_tokens(summary_line)
+            session.summary.append((summary_line, summary_tokens))
+            session.summary_tokens += summary_tokens
+            session.condensed += 1
+            condensed = True
+            while session.summary_tokens > self.summary_budget and session.summary:
+                session.summary_tokens -= session.summary.popleft()[1]
+        if condensed:
+            # The condensed block is small and bounded by its own budget, so it is simply rebuilt
+            lines = ["Earlier turns (condensed):"] + [line for line, _ in session.summary]
+            session.summary_text = "\n".join(lines) if session.summary else ""
+
+    @staticmethod
+    def _pop(session):
+        role, line, tokens = session.messages.popleft()
+        session.tokens -= tokens
+        # Cut the line and its newline off the front of the transcript
+        session.transcript = session.transcript[len(line) + 1:]
+        return role, line
+
+    def stats(self):
+        with self._lock:
+            sessions = self._sessions.values()
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(s.messages) for s in sessions),
+                "tokens": sum(s.tokens + s.summary_tokens for s in sessions),
+                "bytes": sum(len(s.transcript) + len(s.summary_text) for s in sessions),
+                "condensedTurns": sum(s.condensed for s in sessions),
+                "evictedSessions": self.evicted_sessions,
+                "tokenBudget": self.token_budget,
+                "perSession": {
+                    sid: {
+                        "messages": len(s.messages),
+                        "tokens": s.tokens,
+                        "summaryTokens": s.summary_tokens,
+                        "idleSeconds": round(time.time() - s.last_seen)
+                    }
+                    for sid, s in self._sessions.items()
+                }
+            }
+
+
+chat_sessions = ChatSessions(
+    CHAT_HISTORY_TOKEN_BUDGET, CHAT_SUMMARY_TOKEN_BUDGET, CHAT_SESSION_IDLE_TTL, MAX_CHAT_SESSIONS
+)
@@ -0,0 +1,125 @@
+"""
+HTTP client for the Disha API
+Replays the editTrains call captured from the browser through a pooled keep-alive session
+"""
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+EDIT_TRAINS_URL = "https://api.disha.corover.ai/dishaAPI/bot/editTrains/en"
+SCHEDULE_URL = "https://api.disha.corover.ai/dishaAPI/bot/trnscheduleEnq/{train_number}"
+
+# Seconds to wait for a replayed search before giving up and using the browser
+REPLAY_TIMEOUT = float(os.getenv("DISHA_REPLAY_TIMEOUT", "15"))
+SCHEDULE_TIMEOUT = float(os.getenv("DISHA_SCHEDULE_TIMEOUT", "15"))
+
+# Headers that belong to the captured connection, not to the request itself. Stripped both when
+# a call is captured and when it is replayed
+HOP_HEADERS = {'host', 'content-length', 'accept-encoding', 'connection'}
+
+# trnscheduleEnq needs no tokens, only browser-like headers
+SCHEDULE_HEADERS = {
+    "accept": "application/json, text/plain, */*",
+    "accept-language": "en-GB,en-IN;q=0.9,en-US;q=0.8,en;q=0.7",
+    "content-type": "application/json",
+    "origin": "https://askdisha.irctc.co.in",
+    "referer": "https://askdisha.irctc.co.in/",
+    "sec-ch-ua": '"Chromium";v="140", "Not=A?Brand";v="24", "Google Chrome";v="140"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Linux"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "cross-site",
+    "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36"
+}
+
+# One session for the whole process so TLS connections to the Disha API are reused
+session = requests.Session()
+session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=int(os.getenv("DISHA_HTTP_POOL_SIZE", "10"))
+))
+
+
+class TokensRejected(Exception):
+    """Raised when the Disha API does not accept the captured tokens"""
+
+
+def replay_search(captured_payload, captured_headers, SRC, DST, JDATE, JQUOTA, timeout=REPLAY_TIMEOUT):
+    """
+    Call editTrains directly using the payload and headers captured from the browser
+
+    Args:
+        captured_payload: editTrains request body captured by getTrainDetailsWithRefresh
+        captured_headers: editTrains request headers captured by getTrainDetailsWithRefresh
+        SRC, DST, JDATE, JQUOTA: Route, date (YYYYMMDD) and quota to search
+        timeout: Seconds to wait for the upstream response
+
+    Returns:
+        (response_json, upstream latency in ms)
+
+    Raises:
+        TokensRejected: The tokens are stale and a browser search is needed to refresh them
+        requests.RequestException: Network level failure
+    """
+    payload = dict(captured_payload)
+    payload.update({
+        "source": SRC,
+        "destination": DST,
+        "journeyDate": JDATE,
+        "jQuota": JQUOTA
+    })
+    headers = {k: v for k, v in captured_headers.items() if k.lower() not in HOP_HEADERS}
+
+    started = time.monotonic()
+    response = session.post(EDIT_TRAINS_URL, json=payload, headers=headers, timeout=timeout)
+    elapsed = time.monotonic() - started
+    latency_ms = round(elapsed * 1000)
+    metrics.observe_upstream("editTrains", response.status_code, len(response.content), elapsed)
+
+    if response.status_code in (401, 403):
+        raise TokensRejected(f"editTrains returned {response.status_code}")
+    if response.status_code != 200:
+        raise TokensRejected(f"editTrains returned unexpected status {response.status_code}")
+
+    try:
+        data = response.json()
+    except ValueError:
+        raise TokensRejected("editTrains returned a non-JSON body")
+
+    # An expired dSession comes back as 200 with an error body and no train list
+    if 'trainBtwnStnsList' not in data:
+        raise TokensRejected(f"editTrains response has no train list: {str(data)[:200]}")
+
+    return data, latency_ms
+
+
+def fetch_schedule(train_number, journey_date, starting_station, timeout=SCHEDULE_TIMEOUT):
+    """
+    Fetch a train's schedule from trnscheduleEnq over the shared keep-alive session
+
+    Args:
+        train_number: Train number
+        journey_date: Journey date (YYYYMMDD)
+        starting_station: Station code the journey starts from
+        timeout: Seconds to wait for the upstream response
+
+    Returns:
+        The requests.Response, whatever its status
+
+    Raises:
+        requests.RequestException: Network level failure
+    """
+    started = time.monotonic()
+    response = session.get(
+        SCHEDULE_URL.format(train_number=train_number),
+        headers=SCHEDULE_HEADERS,
+        params={"journeyDate": journey_date, "startingStationCode": starting_station},
+        timeout=timeout
+    )
+    metrics.observe_upstream(
+        "trnscheduleEnq", response.status_code, len(response.content), time.monotonic() - started
+    )
+    return response
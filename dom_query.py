@@ -0,0 +1,66 @@
+"""
+DOM queries that cost one WebDriver round trip
+Each helper runs a single script that returns element handles together with their text, instead
+of a find_elements call followed by one .text/textContent call per element
+"""
+from selenium.webdriver.common.by import By
+
+# Result cards on the search results page and the button that opens a card's booking drawer
+TRAIN_CARD_CSS = "div[class*='sc-gplwa-d']"
+TICKET_BUTTON_CSS = "div[class*='ticket-new']"
+
+_XPATH_TEXTS = """
+const snapshot = document.evaluate(arguments[0], arguments[1] || document, null,
+    XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const items = [];
+for (let i = 0; i < snapshot.snapshotLength; i++) {
+    const node = snapshot.snapshotItem(i);
+    items.push([node, node.textContent.trim()]);
+}
+return items;
+"""
+
+_TRAIN_CARDS = """
+return Array.from(document.querySelectorAll(arguments[0])).map(card => [
+    card,
+    Array.from(card.querySelectorAll('p'), p => p.textContent.trim()),
+    card.querySelector(arguments[1])
+]);
+"""
+
+
+def texts(driver, locator, root=None):
+    """[(element, trimmed textContent)] for every element an XPath locator matches, in document order"""
+    by, xpath = locator
+    if by != By.XPATH:
+        raise ValueError(f"texts() needs an XPath locator, got {by}")
+    return [tuple(item) for item in driver.execute_script(_XPATH_TEXTS, xpath, root)]
+
+
+def find_option(driver, locator, text):
+    """
+    The element among locator's matches whose text equals text.
+    None while nothing matches yet (list not rendered), False when the list has no such option.
+    """
+    options = texts(driver, locator)
+    if not options:
+        return None
+    for element, option_text in options:
+        if option_text == text:
+            return element
+    return False
+
+
+def train_cards(driver):
+    """[(card, paragraph texts, ticket button or None)] for every train card on the results page"""
+    return [tuple(card) for card in driver.execute_script(_TRAIN_CARDS, TRAIN_CARD_CSS, TICKET_BUTTON_CSS)]
+
+
+def find_train_card(driver, train_number):
+    """(card, title text, ticket button) of the card for train_number, or None if it isn't rendered"""
+    marker = f"({train_number})"
+    for card, paragraphs, ticket_button in train_cards(driver):
+        for text in paragraphs:
+            if marker in text:
+                return card, text, ticket_button
+    return None
@@ -0,0 +1,238 @@
+"""
+Pool of pre-launched selenium-wire Chrome drivers
+Requests check a driver out, use it and check it back in. A chat session keeps getting the
+same driver while it is free, so multi-step flows (search -> book -> OTP) stay on one browser.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "1"))
+# Seconds a request waits for a free driver before failing
+DRIVER_CHECKOUT_TIMEOUT = float(os.getenv("DRIVER_CHECKOUT_TIMEOUT", "120"))
+# Seconds between keepalive probes of idle drivers
+DRIVER_KEEPALIVE_INTERVAL = float(os.getenv("DRIVER_KEEPALIVE_INTERVAL", "30"))
+
+
+class DriverPoolExhausted(Exception):
+    """Raised when no driver becomes free within the checkout timeout"""
+
+
+class PooledDriver:
+    def __init__(self, index):
+        self.index = index
+        self.driver = None
+        self.session_id = None  # session this driver's page state belongs to
+        self.route = None  # search key of the results page the browser shows
+        self.in_use = False
+        self.ready = False  # launched and warmed up
+        self.launch_failed = False  # the last launch raised; the keepalive retries it
+        self.last_used = 0.0
+        self.restarts = 0
+
+
+class DriverPool:
+    def __init__(self, size, factory, warmup=None):
+        """
+        Args:
+            size: Number of drivers
+            factory: Creates a new driver
+            warmup: Optional callable run on every new driver (e.g. to pre-navigate it)
+        """
+        self.size = size
+        self.factory = factory
+        self.warmup = warmup
+        self.slots = [PooledDriver(i) for i in range(size)]
+        self._cond = threading.Condition()
+        self._started = False
+        self._keepalive = None
+
+    def start(self):
+        """Launch and warm up every driver that isn't running yet, in parallel"""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            # Hold the slots while they launch so requests wait for them instead of launching their own
+            pending = [s for s in self.slots if s.driver is None and not s.in_use]
+            for slot in pending:
+                slot.in_use = True
+
+        def launch(slot):
+            try:
+                self._launch(slot)
+            except Exception as e:
+                print(f"Failed to launch pooled driver {slot.index}: {e}")
+            finally:
+                self.checkin(slot)
+
+        threads = [threading.Thread(target=launch, args=(slot,), daemon=True) for slot in pending]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start_background(self, interval=DRIVER_KEEPALIVE_INTERVAL):
+        """Warm up the pool and keep probing it from a daemon thread"""
+        if self._keepalive is not None:
+            return
+
+        def run():
+            self.start()
+            while True:
+                time.sleep(interval)
+                try:
+                    self.health_check()
+                except Exception as e:
+                    print(f"Driver keepalive failed: {e}")
+
+        self._keepalive = threading.Thread(target=run, name="driver-keepalive", daemon=True)
+        self._keepalive.start()
+
+    def is_ready(self):
+        """True once at least one driver is launched and warmed up"""
+        with self._cond:
+            return any(s.ready for s in self.slots)
+
+    def has_session(self, session_id):
+        with self._cond:
+            return any(slot.session_id == session_id for slot in self.slots)
+
+    def checkout(self, session_id, timeout=DRIVER_CHECKOUT_TIMEOUT, launch=True):
+        """
+        Take a driver for exclusive use. The session's own driver is preferred, then an
+        unassigned one, then the least recently used driver of another session.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                slot = self._pick(session_id)
+                if slot is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DriverPoolExhausted(f"No browser became free within {timeout}s")
+                self._cond.wait(remaining)
+
+            if slot.session_id != session_id:
+                # Page state belongs to someone else, so the results page can't be reused
+                slot.session_id = session_id
+                slot.route = None
+            slot.in_use = True
+
+        try:
+            if launch:
+                self._ensure_alive(slot)
+        except Exception:
+            self.checkin(slot)
+            raise
+        return slot
+
+    def checkin(self, slot):
+        with self._cond:
+            slot.in_use = False
+            slot.last_used = time.time()
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, session_id, launch=True):
+        slot = self.checkout(session_id, launch=launch)
+        try:
+            yield slot
+        finally:
+            self.checkin(slot)
+
+    def release(self, session_id):
+        """Forget which driver belongs to a session"""
+        with self._cond:
+            for slot in self.slots:
+                if slot.session_id == session_id:
+                    slot.session_id = None
+                    slot.route = None
+
+    def quit(self, slot):
+        """
+        Quit a checked out driver. It is relaunched the next time it is checked out, but not by
+        the keepalive, so a browser closed on purpose stays closed while nobody needs it.
+        """
+        if slot.driver is not None:
+            try:
+                slot.driver.quit()
+            except Exception:
+                pass
+        slot.driver = None
+        slot.route = None
+        slot.ready = False
+        slot.launch_failed = False
+
+    def health_check(self):
+        """Probe idle drivers, relaunch the ones whose session died and retry failed launches"""
+        for slot in self.slots:
+            with self._cond:
+                if slot.in_use or (slot.driver is None and not slot.launch_failed):
+                    continue
+                slot.in_use = True
+            try:
+                self._ensure_alive(slot)
+            except Exception as e:
+                print(f"Failed to relaunch pooled driver {slot.index}: {e}")
+            finally:
+                self.checkin(slot)
+
+    def _pick(self, session_id):
+        own = [s for s in self.slots if s.session_id == session_id]
+        if own:
+            # Wait for the session's own driver rather than losing its page state
+            return own[0] if not own[0].in_use else None
+        free = [s for s in self.slots if not s.in_use]
+        if not free:
+            return None
+        unassigned = [s for s in free if s.session_id is None]
+        if unassigned:
+            return unassigned[0]
+        return min(free, key=lambda s: s.last_used)
+
+    def _ensure_alive(self, slot):
+        if slot.driver is None:
+            self._launch(slot)
+            return
+        try:
+            slot.driver.current_url  # Raises if the browser session is gone
+        except Exception:
+            print(f"Pooled driver {slot.index} is dead, relaunching")
+            self.quit(slot)
+            self._launch(slot)
+            slot.restarts += 1
+
+    def _launch(self, slot):
+        slot.ready = False
+        slot.route = None
+        try:
+            slot.driver = self.factory()
+            if self.warmup:
+                self.warmup(slot.driver)
+        except Exception:
+            slot.launch_failed = True
+            raise
+        slot.launch_failed = False
+        slot.ready = True
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "inUse": sum(1 for s in self.slots if s.in_use),
+                "drivers": [
+                    {
+                        "index": s.index,
+                        "running": s.driver is not None,
+                        "ready": s.ready,
+                        "launchFailed": s.launch_failed,
+                        "inUse": s.in_use,
+                        "session": s.session_id,
+                        "restarts": s.restarts
+                    }
+                    for s in self.slots
+                ]
+            }
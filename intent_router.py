@@ -0,0 +1,127 @@
+"""
+Fast path for structured follow-up questions
+Short messages like "cheapest in 3A" or "fastest trains" map onto a single read of the cached
+search, so once a search exists they are answered by calling the tool directly instead of
+running the ReAct agent. Anything the patterns don't fully match goes to the LLM.
+"""
+import os
+import re
+
+from tools import (
+    get_available_trains,
+    get_cheapest_trains,
+    get_fastest_trains,
+    get_train_details,
+    get_trains_summary,
+    get_trains_by_class,
+    get_trains_by_type,
+    has_cached_search
+)
+
+FAST_PATH_ROUTER = os.getenv("FAST_PATH_ROUTER", "true").lower() in ("1", "true", "yes")
+
+# Spoken class names -> class codes the backend uses
+CLASS_ALIASES = {
+    "1a": "1A", "1ac": "1A", "first ac": "1A",
+    "2a": "2A", "2ac": "2A", "second ac": "2A", "2 tier": "2A",
+    "3a": "3A", "3ac": "3A", "third ac": "3A", "3 tier": "3A",
+    "3e": "3E", "3 economy": "3E",
+    "sl": "SL", "sleeper": "SL",
+    "cc": "CC", "chair car": "CC",
+    "ec": "EC", "executive chair car": "EC",
+    "2s": "2S", "second sitting": "2S"
+}
+TYPE_ALIASES = {
+    "rajdhani": "RAJ", "shatabdi": "SHT", "duronto": "DUR",
+    "superfast": "SF", "express": "EXP", "mail": "MAIL"
+}
+
+_CLASS = "(?P<cls>" + "|".join(sorted(map(re.escape, CLASS_ALIASES), key=len, reverse=True)) + ")"
+_TYPE = "(?P<type>" + "|".join(TYPE_ALIASES) + ")"
+_TRAINS = r"(?: trains?| options?| tickets?)?"
+
+# Politeness around the actual request, stripped before matching
+_LEADING = re.compile(
+    r"^(?:(?:please|pls|ok|okay|now|and|so|can you|could you|me|what|which|are|is|the|all|only|us)\s+)*"
+)
+_TRAILING = re.compile(r"(?:\s+(?:please|pls|now|only|too|then))*$")
+# A leading verb that makes a bare class, type or train number a request for a listing
+_LISTING = re.compile(r"^(?:show|list|get|find|give|tell|display|see)(?: me| us)?(?: (?:the|all|only))*\s+")
+
+# (intent, pattern, needs a listing verb). Patterns without a verb must name what they list, so a
+# bare "sl" or "12301" answering the agent's own question ("which class?") never matches.
+INTENTS = [
+    ("cheapest", re.compile(rf"(?:cheapest|lowest fare|lowest fares){_TRAINS}(?: (?:in|for|with) {_CLASS}(?: class)?)?"), False),
+    ("cheapest", re.compile(rf"cheapest {_CLASS}(?: class)?{_TRAINS}"), False),
+    ("fastest", re.compile(rf"(?:fastest|quickest|shortest){_TRAINS}"), False),
+    ("available", re.compile(
+        r"(?:available trains?|trains? (?:that )?(?:are |have )?(?:available|seats available|with (?:available )?seats)|availability)"
+    ), False),
+    ("summary", re.compile(r"(?:trains? )?summary(?: of (?:the )?(?:trains|results|search))?"), False),
+    ("details", re.compile(r"(?:details|info|information) (?:of|for|about|on)(?: train)? (?P<number>\d{5})"), False),
+    ("details", re.compile(r"train (?P<number>\d{5})(?: details| info)?"), True),
+    ("by_class", re.compile(rf"trains? (?:in|with) {_CLASS}(?: class)?"), False),
+    ("by_class", re.compile(rf"{_CLASS}(?: class)? trains"), False),
+    ("by_class", re.compile(rf"(?:(?:in|with) )?{_CLASS}(?: class)?"), True),
+    ("by_type", re.compile(rf"{_TYPE} trains"), False),
+    ("by_type", re.compile(rf"{_TYPE}"), True),
+]
+
+
+def match(message):
+    """(intent, params) for a message the fast path can answer, or None"""
+    text = re.sub(r"[?!.,]+", " ", message.lower())
+    text = " ".join(text.split())
+    text = _TRAILING.sub("", _LEADING.sub("", text))
+    listing = _LISTING.match(text)
+    if listing:
+        text = text[listing.end():]
+    for intent, pattern, needs_listing in INTENTS:
+        if needs_listing and not listing:
+            continue
+        found = pattern.fullmatch(text)
+        if found:
+            params = found.groupdict()
+            if params.get("cls"):
+                params["cls"] = CLASS_ALIASES[params["cls"]]
+            if params.get("type"):
+                params["type"] = TYPE_ALIASES[params["type"]]
+            return intent, params
+    return None
+
+
+def run(intent, params):
+    if intent == "cheapest":
+        return get_cheapest_trains.invoke({"train_class": params.get("cls")})
+    if intent == "fastest":
+        return get_fastest_trains.invoke("")
+    if intent == "available":
+        return get_available_trains.invoke("")
+    if intent == "summary":
+        return get_trains_summary.invoke("")
+    if intent == "details":
+        return get_train_details.invoke(params["number"])
+    if intent == "by_class":
+        return get_trains_by_class.invoke(params["cls"])
+    if intent == "by_type":
+        return get_trains_by_type.invoke(params["type"])
+    raise ValueError(f"Unknown intent {intent}")
+
+
+def route(message, last_reply=None):
+    """
+    Answer a structured follow-up directly from the cached search of the current session.
+    Returns the reply, or None when the message needs the agent (or no search is cached yet).
+    last_reply is the agent's previous message; when it asked a question, the message is
+    taken as the answer to it and left to the agent.
+    """
+    if not FAST_PATH_ROUTER:
+        return None
+    if last_reply and last_reply.rstrip().endswith("?"):
+        return None
+    matched = match(message)
+    if matched is None or not has_cached_search():
+        return None
+    intent, params = matched
+    print(f"Fast path: {intent} {params}")
+    return run(intent, params)
@@ -0,0 +1,126 @@
+"""
+Background jobs for slow backend operations
+Operations are queued and run by worker threads; clients get a job id right away and poll for
+progress and the result instead of holding an HTTP request open for the whole operation
+"""
+import os
+import time
+import uuid
+import queue
+import threading
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Seconds a finished job's result stays available
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_current = threading.local()
+
+
+class Job:
+    def __init__(self, operation, session_id, fn):
+        self.id = uuid.uuid4().hex
+        self.operation = operation
+        self.session_id = session_id
+        self.fn = fn
+        self.status = QUEUED
+        self.progress = None
+        self.result = None  # response body
+        self.status_code = None  # response status
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "operation": self.operation,
+            "status": self.status,
+            "progress": self.progress,
+            "statusCode": self.status_code,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at
+        }
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, result_ttl=JOB_RESULT_TTL):
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, operation, session_id, fn):
+        """Queue fn, which returns (response body, status code), and return its Job"""
+        job = Job(operation, session_id, fn)
+        with self._lock:
+            self._sweep()
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job, timeout):
+        """Block up to timeout seconds for a job to finish; True if it has"""
+        return job._done.wait(timeout)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = RUNNING
+            job.started_at = time.time()
+            _current.job = job
+            try:
+                job.result, job.status_code = job.fn()
+                job.status = SUCCEEDED if job.status_code < 400 else FAILED
+            except Exception as e:
+                print(f"Job {job.id} ({job.operation}) failed: {e}")
+                job.result, job.status_code = {"error": f"{job.operation} failed", "details": str(e)}, 500
+                job.status = FAILED
+            finally:
+                _current.job = None
+                job.finished_at = time.time()
+                job.fn = None
+                job._done.set()
+
+    def _sweep(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {"workers": len(self._workers), "queued": self._queue.qsize(), "jobs": counts}
+
+
+def report_progress(message):
+    """Record a progress message on the job running in this thread (no-op outside jobs)"""
+    job = getattr(_current, "job", None)
+    if job is not None:
+        job.progress = message
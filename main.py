@@ -3,21 +3,68 @@ warnings.filterwarnings("ignore", category=UserWarning, module="seleniumwire")
 
 from seleniumwire import webdriver as seleniumwire_webdriver 
 from selenium.webdriver.common.by import By
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 from datetime import date, timedelta, datetime
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+import os
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import time
 import json
 import requests as re
 from agent import chat, clear_history
+from chat_history import chat_sessions
+import disha_client
+import tools
+from tool_transport import InProcessTransport
+import search_cache
+import schedule_cache
+import persistent_store
+import browser_waits
+import dom_query
+import passenger_form
+import metrics
+from step_timings import step_timings, timed
+from search_sessions import search_sessions, DEFAULT_SESSION
+from route_refresher import RouteRefresher
+from jobs import JobQueue, report_progress
+from traffic_capture import TrafficCapture
+from train_index import build_train_index, merge_search_results, merge_station_pairs, to_minutes, STATUS_AVAILABLE, STATUS_WAITLIST, STATUS_RAC
+from stations import station_codes
+from driver_pool import DriverPool, DriverPoolExhausted, DRIVER_POOL_SIZE
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend integration
 
-driver = None
-cached_train_data = None
+# "inprocess" lets the /chat agent's tools call this app directly; "http" sends them to BACKEND_URL
+TOOL_TRANSPORT = os.getenv("TOOL_TRANSPORT", "inprocess")
+if TOOL_TRANSPORT == "inprocess":
+    tools.use_transport(InProcessTransport(app))
+
+# Upper bound (seconds) on how long a search waits for the editTrains response
+SEARCH_CAPTURE_TIMEOUT = float(os.getenv("SEARCH_CAPTURE_TIMEOUT", "30"))
+
+DISHA_HOME_URL = "https://askdisha.irctc.co.in/"
+# Upper bound (seconds) on waiting for the Disha home page to render
+HOME_PAGE_TIMEOUT = float(os.getenv("HOME_PAGE_TIMEOUT", "20"))
+
+# Warm the browser pool and start the keepalive and route refresher when the app is set up
+START_BACKGROUND_WORKERS = os.getenv("START_BACKGROUND_WORKERS", "true").lower() in ("1", "true", "yes")
+
+# Longest a /jobs/<id>/result request blocks waiting for the job (seconds)
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+
+# Flexible-date searches: default and largest +/- window in days, and dates fetched at once
+FLEX_SEARCH_DEFAULT_DAYS = int(os.getenv("FLEX_SEARCH_DEFAULT_DAYS", "2"))
+FLEX_SEARCH_MAX_DAYS = int(os.getenv("FLEX_SEARCH_MAX_DAYS", "3"))
+FLEX_SEARCH_WORKERS = int(os.getenv("FLEX_SEARCH_WORKERS", "4"))
+
+# City searches: main stations used per city and station pairs searched at once
+CITY_SEARCH_MAX_STATIONS = int(os.getenv("CITY_SEARCH_MAX_STATIONS", "4"))
+CITY_SEARCH_WORKERS = int(os.getenv("CITY_SEARCH_WORKERS", "4"))
 
 userTokens = {
     'userName': {
@@ -76,118 +123,213 @@ def init_driver():
 #     return driver
 
 
-def init_driver():
-    global driver
-    if driver is None:
-        options = seleniumwire_webdriver.ChromeOptions()
-        options.add_argument('user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36')
-        
-        # Disable blink features that check for focus
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        
-        # Disable background timer throttling (helps with hidden tabs)
-        options.add_argument('--disable-backgrounding-occluded-windows')
-        options.add_argument('--disable-renderer-backgrounding')
-        
-        # Disable hang monitor to prevent timeouts
-        options.add_argument('--disable-hang-monitor')
-        
-        # Enable DOM automation features
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        
-        # Set window size (required for some dynamic content)
-        options.add_argument('--window-size=1920,1080')
-        
-        # Don't minimize - it breaks JavaScript execution
-        # Instead, we'll move window off-screen after creation
-        
-        driver = seleniumwire_webdriver.Chrome(options=options)
+@metrics.DRIVER_LAUNCH.time()
+def create_driver():
+    """Launch a new Chrome instance configured for the Disha SPA (used by the driver pool)"""
+    options = seleniumwire_webdriver.ChromeOptions()
+    options.add_argument('user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36')
+    
+    # Disable blink features that check for focus
+    options.add_argument('--disable-blink-features=AutomationControlled')
+    
+    # Disable background timer throttling (helps with hidden tabs)
+    options.add_argument('--disable-backgrounding-occluded-windows')
+    options.add_argument('--disable-renderer-backgrounding')
+    
+    # Disable hang monitor to prevent timeouts
+    options.add_argument('--disable-hang-monitor')
+    
+    # Enable DOM automation features
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+    
+    # Set window size (required for some dynamic content)
+    options.add_argument('--window-size=1920,1080')
+    
+    # Don't minimize - it breaks JavaScript execution
+    # Instead, we'll move window off-screen after creation
+    
+    driver = seleniumwire_webdriver.Chrome(options=options)
+    
+    # Index Disha API responses as they arrive instead of scanning driver.requests
+    TrafficCapture([disha_client.EDIT_TRAINS_URL]).install(driver)
+    
+    # Move browser window off-screen (but keep it "visible" to the OS)
+    # Temporarily disabled for debugging - uncomment when ready
+    driver.set_window_position(-2000, 0)  # Move to left off-screen
+    
+    # Execute CDP commands to mask automation
+    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+        'source': '''
+            Object.defineProperty(document, 'hidden', {
+                get: function() { return false; }
+            });
+            Object.defineProperty(document, 'visibilityState', {
+                get: function() { return 'visible'; }
+            });
+            window.focus = function() {};
+            Object.defineProperty(navigator, 'webdriver', {
+                get: () => undefined
+            });
+        '''
+    })
+    
+    return driver
+
+def open_home_page(driver, timeout=HOME_PAGE_TIMEOUT):
+    """Navigate to Disha and wait until the chat UI is rendered"""
+    driver.get(DISHA_HOME_URL)
+    WebDriverWait(driver, timeout).until(
+        EC.presence_of_element_located((By.ID, "corover-body"))
+    )
+
+# Drivers are launched and pre-navigated to Disha before any request needs them
+driver_pool = DriverPool(DRIVER_POOL_SIZE, create_driver, warmup=open_home_page)
+job_queue = JobQueue()
+metrics.register(
+    {"search": search_cache.search_cache, "schedule": schedule_cache.schedule_cache},
+    driver_pool,
+    chat_sessions=lambda: len(chat_sessions)
+)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Label by the route pattern so /trains/<n> doesn't create a series per train
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        metrics.REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - started)
+    return response
+
+def current_session_id():
+    """Chat session a request belongs to, sent by the agent tools as X-Session-Id"""
+    return request.headers.get('X-Session-Id') or request.args.get('session_id') or DEFAULT_SESSION
+
+def with_driver(launch=True):
+    """
+    Check out the requesting session's pooled driver for the duration of the view and
+    pass it in as the first argument. With launch=False the view only gets a driver the
+    session already has, and None otherwise.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            session_id = current_session_id()
+            if not launch and not driver_pool.has_session(session_id):
+                return view(None, *args, **kwargs)
+            try:
+                with driver_pool.lease(session_id, launch=launch) as slot:
+                    return view(slot, *args, **kwargs)
+            except DriverPoolExhausted as e:
+                return jsonify({"error": "All browsers are busy, please retry", "details": str(e)}), 503
+        return wrapper
+    return decorator
+
+def run_as_job(view):
+    """
+    Let a slow view run as a background job. With ?async=1 (or a "Prefer: respond-async" header)
+    the request is queued and answered with 202 and a job id right away; the view then runs on a
+    job worker against a copy of the request, and GET /jobs/<id>/result returns its response.
+    Without the flag the view runs inline as before.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        wants_async = request.args.get('async') in ('1', 'true') or 'respond-async' in request.headers.get('Prefer', '')
+        if not wants_async:
+            return view(*args, **kwargs)
         
-        # Move browser window off-screen (but keep it "visible" to the OS)
-        # Temporarily disabled for debugging - uncomment when ready
-        driver.set_window_position(-2000, 0)  # Move to left off-screen
+        session_id = current_session_id()
+        path, method = request.path, request.method
+        body = request.get_json(silent=True)
+        query = {k: v for k, v in request.args.items() if k != 'async'}
         
-        # Execute CDP commands to mask automation
-        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-            'source': '''
-                Object.defineProperty(document, 'hidden', {
-                    get: function() { return false; }
-                });
-                Object.defineProperty(document, 'visibilityState', {
-                    get: function() { return 'visible'; }
-                });
-                window.focus = function() {};
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => undefined
-                });
-            '''
-        })
+        def run():
+            with app.test_request_context(path, method=method, json=body, query_string=query,
+                                          headers={'X-Session-Id': session_id}):
+                response = app.make_response(view(*args, **kwargs))
+                return response.get_json(silent=True), response.status_code
         
-    else:
-        try:
-            driver.current_url
-        except:
-            try:
-                driver.quit()
-            except:
-                pass
-            driver = None
-            options = seleniumwire_webdriver.ChromeOptions()
-            options.add_argument('user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36')
-            options.add_argument('--disable-blink-features=AutomationControlled')
-            options.add_argument('--disable-backgrounding-occluded-windows')
-            options.add_argument('--disable-renderer-backgrounding')
-            options.add_argument('--disable-hang-monitor')
-            options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            options.add_experimental_option('useAutomationExtension', False)
-            options.add_argument('--window-size=1920,1080')
-            
-            driver = seleniumwire_webdriver.Chrome(options=options)
-            
-            # Move off-screen
-            driver.set_window_position(-2000, 0)
-            
-            driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-                'source': '''
-                    Object.defineProperty(document, 'hidden', {
-                        get: function() { return false; }
-                    });
-                    Object.defineProperty(document, 'visibilityState', {
-                        get: function() { return 'visible'; }
-                    });
-                    window.focus = function() {};
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    });
-                '''
-            })
-    
-    return driver
+        job = job_queue.submit(view.__name__, session_id, run)
+        return jsonify({
+            **job.to_dict(),
+            "statusUrl": f"/jobs/{job.id}",
+            "resultUrl": f"/jobs/{job.id}/result"
+        }), 202, {"Location": f"/jobs/{job.id}"}
+    return wrapper
+
+def session_job(job_id):
+    """The job if it belongs to the requesting session, else None; other sessions' jobs look missing"""
+    job = job_queue.get(job_id)
+    if job is None or job.session_id != current_session_id():
+        return None
+    return job
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = session_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    """
+    The finished job's response, with the status the operation returned. Pass ?wait=<seconds>
+    (at most JOB_MAX_WAIT) to block until it finishes; still running jobs answer 202 with their status.
+    """
+    job = session_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    try:
+        wait = min(float(request.args.get('wait') or 0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"status": 400, "message": "wait must be a number of seconds"}), 400
+    if not job.done and wait > 0:
+        job_queue.wait(job, wait)
+    if not job.done:
+        return jsonify(job.to_dict()), 202
+    return jsonify(job.result), job.status_code
+
+@app.route("/ready", methods=["GET"])
+def readiness():
+    """
+    Readiness probe: 200 once a pooled browser is launched and on the Disha home page,
+    503 while the pool is still warming up.
+    """
+    ready = driver_pool.is_ready()
+    return jsonify({
+        "ready": ready,
+        "drivers": driver_pool.stats()
+    }), 200 if ready else 503
 
 @app.route("/closeBrowser", methods=["GET"])
-def closeBrowser():
-    global driver
-    if driver:
-        driver.quit()
-        driver = None
+@with_driver(launch=False)
+def closeBrowser(slot):
+    if slot and slot.driver:
+        driver_pool.quit(slot)
+        driver_pool.release(current_session_id())
         return jsonify({"message": "Browser closed successfully"}), 200
     return jsonify({"message": "Browser was not running"}), 200
 
 @app.route("/init-browser", methods=["GET"])
-def initialize_browser():
-    global driver
+@with_driver()
+def initialize_browser(slot):
+    driver = slot.driver
     try:
-        if driver:
+        if driver.current_url.startswith("https://askdisha.irctc.co.in"):
             return jsonify({
                 "message": "Browser already running",
                 "status": "already_initialized"
             })
         
         print("Initializing browser...")
-        driver = init_driver()
-        driver.get("https://askdisha.irctc.co.in/")
-        time.sleep(5)
+        open_home_page(driver)
+        slot.route = None
         
         return jsonify({
             "message": "Browser initialized successfully",
@@ -204,141 +346,425 @@ def initialize_browser():
             "details": str(e)
         }), 500
     
+def log_search_result(response_json):
+    # Debug logging - print cache structure
+    print("\n" + "="*80)
+    print("CACHED TRAIN DATA STRUCTURE:")
+    print("="*80)
+    print(f"Total trains cached: {len(response_json.get('trainBtwnStnsList', []))}")
+    
+    # Show first train's structure
+    if response_json.get('trainBtwnStnsList'):
+        first_train = response_json['trainBtwnStnsList'][0]
+        print(f"\nFirst train example: {first_train.get('trainNumber')} - {first_train.get('trainName')}")
+        print(f"Keys in train object: {list(first_train.keys())}")
+        
+        if first_train.get('availability'):
+            print(f"\nAvailability data structure:")
+            first_avl = first_train['availability'][0]
+            print(f"Keys in availability: {list(first_avl.keys())}")
+            print(f"Sample availability: {json.dumps(first_avl, indent=2)}")
+    
+    print("="*80 + "\n")
+
+def browser_search(slot, SRC, DST, JDATE, JQUOTA, timeout=SEARCH_CAPTURE_TIMEOUT):
+    """
+    Run a search in a checked out pooled browser and capture the editTrains call it makes.
+    Refreshes the captured tokens/headers used by replay searches.
+    Returns (response_json, searchMeta). Raises TimeoutException if no response arrives in time.
+    """
+    driver = slot.driver
+    capture = driver.traffic_capture
+    
+    # Forget the previous search's call (and selenium-wire's stored traffic) before navigating
+    capture.reset(disha_client.EDIT_TRAINS_URL)
+    del driver.requests
+    
+    started = time.monotonic()
+    driver.get(f"https://askdisha.irctc.co.in/?FROM={SRC}&TO={DST}&DATE={JDATE}&QUOTA={JQUOTA}")
+
+    # Return as soon as the editTrains call has a response instead of sleeping a fixed 15s
+    call = capture.wait_for(disha_client.EDIT_TRAINS_URL, timeout=timeout)
+    capture_ms = round((time.monotonic() - started) * 1000)
+    slot.route = (SRC, DST, JDATE, JQUOTA)
+    metrics.observe_upstream("editTrains", call.status_code, call.response_size, call.latency_ms / 1000)
+
+    if call.payload:
+        payload = call.payload
+        
+        userTokens['userName']['userToken'] = payload.get("userToken")
+        userTokens['userName']['dSession'] = payload.get("dSession")
+        userTokens['userName']['sessionId'] = payload.get("sessionId")
+        userTokens['userName']['capturedPayload'] = payload
+        userTokens['userName']['capturedHeaders'] = call.headers
+    
+    response_json = call.response_json
+    if response_json is None:
+        raise ValueError(f"editTrains returned an unreadable response (HTTP {call.status_code})")
+
+    upstream_ms = call.latency_ms
+    print(f"editTrains captured in {capture_ms}ms (upstream call took {upstream_ms}ms)")
+    
+    return response_json, {
+        "mode": "browser",
+        "upstreamLatencyMs": upstream_ms,
+        "captureMs": capture_ms,
+        "captureTimeout": timeout
+    }
+
+def have_search_tokens():
+    tokens = userTokens['userName']
+    return bool(tokens['capturedPayload'] and tokens['capturedHeaders'])
+
+def search_train_data(SRC, DST, JDATE, JQUOTA, session_id=DEFAULT_SESSION, timeout=SEARCH_CAPTURE_TIMEOUT, force_browser=False, browser_fallback=True):
+    """
+    Search trains, replaying the captured editTrains request over HTTP when tokens are
+    available and falling back to the browser when they are missing or rejected.
+    With browser_fallback=False replay failures are raised instead (TokensRejected or RequestException).
+    Returns (response_json, searchMeta).
+    """
+    tokens = userTokens['userName']
+    if have_search_tokens() and not force_browser:
+        try:
+            response_json, upstream_ms = disha_client.replay_search(
+                tokens['capturedPayload'], tokens['capturedHeaders'], SRC, DST, JDATE, JQUOTA
+            )
+            print(f"editTrains replayed over HTTP in {upstream_ms}ms")
+            return response_json, {"mode": "replay", "upstreamLatencyMs": upstream_ms}
+        except (disha_client.TokensRejected, re.RequestException) as e:
+            if not browser_fallback:
+                raise
+            print(f"Replay search failed ({e}), falling back to browser")
+    elif not browser_fallback:
+        raise disha_client.TokensRejected("No captured tokens to replay the search with")
+    
+    report_progress("Searching in the browser")
+    with driver_pool.lease(session_id) as slot:
+        return browser_search(slot, SRC, DST, JDATE, JQUOTA, timeout=timeout)
+
+def forget_session_searches(session_id):
+    """
+    Drop a session's searches. Shared cache entries go with them unless another session still
+    holds the same search, so one user clearing doesn't take results away from the others.
+    """
+    for key in search_sessions.clear(session_id):
+        if not search_sessions.holds(key):
+            search_cache.drop_search(key)
+
+def get_cached_index():
+    """
+    Resolve the cached search a /trains/* request refers to, as a TrainIndex.
+    Pass SRC, DST, JDATE and JQUOTA as query parameters to read any cached search,
+    otherwise the latest search of the request's session is used.
+    """
+    session_id = current_session_id()
+    args = request.args
+    if all(args.get(k) for k in ('SRC', 'DST', 'JDATE', 'JQUOTA')):
+        key = search_cache.search_key(args['SRC'], args['DST'], args['JDATE'], args['JQUOTA'])
+    else:
+        key = search_sessions.latest_key(session_id)
+        if key is None:
+            return None
+    
+    # Prefer the shared cache, which background refreshes keep current; the session's copy
+    # covers searches the cache has evicted or expired
+    session_index = search_sessions.get(session_id, key)
+    return search_cache.get_search(key) or session_index
+
+def cached_search(key, session_id=DEFAULT_SESSION, timeout=SEARCH_CAPTURE_TIMEOUT, refresh=False, force_browser=False, browser_fallback=True):
+    """
+    Indexed search result for a search key, from the search cache unless refresh is set.
+    Returns (TrainIndex, searchMeta). Raises TimeoutException, DriverPoolExhausted or ValueError,
+    and with browser_fallback=False also TokensRejected or RequestException.
+    """
+    route_refresher.record(key)
+    
+    # Serve a previous search of this route from memory unless a refresh is requested
+    if not refresh:
+        index, stale = search_cache.lookup_search(key)
+        if index:
+            if stale:
+                # Answer now and refresh behind the response
+                route_refresher.refresh_async(key)
+                print(f"Serving stale {key} from search cache, refreshing in background")
+                return index, {"mode": "cache", "stale": True}
+            print(f"Serving {key} from search cache")
+            return index, {"mode": "cache"}
+    
+    response_json, meta = search_train_data(
+        *key, session_id=session_id, timeout=timeout, force_browser=force_browser, browser_fallback=browser_fallback
+    )
+    
+    # Normalize once here so the /trains/* endpoints never re-parse the payload
+    index = build_train_index(response_json)
+    search_cache.put_search(key, index)
+    log_search_result(response_json)
+    return index, meta
+
+def refresh_search(key):
+    """
+    Re-run a search for the background refresher. Replay only, so refreshes never hold a
+    browser a user is waiting for; without captured tokens there is nothing to refresh with.
+    """
+    response_json, _ = search_train_data(*key, browser_fallback=False)
+    search_cache.put_search(key, build_train_index(response_json))
+    print(f"Refreshed {key} in background")
+
+def is_upcoming_search(key):
+    """False for searches whose journey date has passed (or isn't a YYYYMMDD date)"""
+    try:
+        return datetime.strptime(key[2], '%Y%m%d').date() >= date.today()
+    except ValueError:
+        return False
+
+route_refresher = RouteRefresher(refresh_search, search_cache.search_cache, is_live=is_upcoming_search)
+
+def search_error(e, key, timeout):
+    """(body, status) for an exception raised by cached_search"""
+    if isinstance(e, TimeoutException):
+        print(f"No editTrains response within {timeout}s for {key[0]} -> {key[1]} on {key[2]}")
+        return {
+            "status": 504,
+            "message": f"Timed out after {timeout}s waiting for the train search response"
+        }, 504
+    if isinstance(e, DriverPoolExhausted):
+        return {"status": 503, "message": str(e)}, 503
+    # ValueError, a browser failure, or a replay failure when the browser fallback was disabled
+    return {"status": 502, "message": str(e)}, 502
+
+# What one search of a fan-out may raise; it is reported for that search and the others go on
+FAN_OUT_ERRORS = (
+    TimeoutException, DriverPoolExhausted, ValueError, WebDriverException,
+    disha_client.TokensRejected, re.RequestException
+)
+
+def fan_out_searches(keys, workers, session_id, timeout, refresh):
+    """
+    Run cached_search for every key, up to workers at once, returning {key: (index, meta) or the
+    exception it raised}. The fanned-out searches are replayed over HTTP only: falling back to the
+    browser would queue them all on the session's one driver. So when no tokens are captured yet,
+    the first key runs alone first, through the browser, to capture them.
+    """
+    outcomes = {}
+    if not have_search_tokens():
+        try:
+            outcomes[keys[0]] = cached_search(keys[0], session_id=session_id, timeout=timeout, refresh=refresh)
+        except FAN_OUT_ERRORS as e:
+            outcomes[keys[0]] = e
+    
+    pending = [key for key in keys if key not in outcomes]
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            futures = {
+                key: executor.submit(
+                    cached_search, key, session_id=session_id, timeout=timeout, refresh=refresh, browser_fallback=False
+                )
+                for key in pending
+            }
+        for key, future in futures.items():
+            try:
+                outcomes[key] = future.result()
+            except FAN_OUT_ERRORS as e:
+                outcomes[key] = e
+    return outcomes
+
+def missing_fields(data, fields):
+    """400 response naming the required fields that are absent or empty, None when all are set"""
+    missing = [field for field in fields if data.get(field) is None or not str(data[field]).strip()]
+    if missing:
+        return jsonify({"status": 400, "message": f"Missing required fields: {', '.join(missing)}"}), 400
+    return None
+
+def invalid_numbers(data, fields, kind=float):
+    """400 response naming the optional fields given but not positive numbers of kind, None when all are"""
+    invalid = []
+    for field in fields:
+        if data.get(field) in (None, ''):
+            continue
+        try:
+            if not kind(data[field]) > 0:
+                invalid.append(field)
+        except (TypeError, ValueError):
+            invalid.append(field)
+    if invalid:
+        noun = "whole numbers" if kind is int else "numbers"
+        return jsonify({"status": 400, "message": f"Must be positive {noun}: {', '.join(invalid)}"}), 400
+    return None
+
 @app.route("/getTrainDetailsWithRefresh", methods=["POST"])
+@run_as_job
 def getTrainDetailsWithRefresh():
-    global driver, cached_train_data
-    
     data = request.get_json()
+    invalid = missing_fields(data, ('SRC', 'DST', 'JDATE', 'JQUOTA')) or invalid_numbers(data, ('timeout',))
+    if invalid:
+        return invalid
     SRC = data.get('SRC')
     DST = data.get('DST')
     JDATE = data.get('JDATE')
     JQUOTA = data.get('JQUOTA')
+    timeout = float(data.get('timeout') or SEARCH_CAPTURE_TIMEOUT)
+    session_id = current_session_id()
+    key = search_cache.search_key(SRC, DST, JDATE, JQUOTA)
     
-    # Only initialize driver if it doesn't exist
-    if not driver:
-        driver = init_driver()
-        time.sleep(5)
-    
-    # Clear previous request history to avoid capturing old train search responses
-    del driver.requests
+    try:
+        index, meta = cached_search(
+            key, session_id=session_id, timeout=timeout,
+            refresh=bool(data.get('refresh')), force_browser=bool(data.get('forceBrowser'))
+        )
+    except (TimeoutException, DriverPoolExhausted, ValueError) as e:
+        body, status = search_error(e, key, timeout)
+        return jsonify(body), status
     
-    driver.get(f"https://askdisha.irctc.co.in/?FROM={SRC}&TO={DST}&DATE={JDATE}&QUOTA={JQUOTA}")
-    time.sleep(15)
+    search_sessions.record(session_id, key, index, index.size)
+    return jsonify({**index.data, "searchMeta": meta})
 
-    for req in driver.requests:
-        if 'https://api.disha.corover.ai/dishaAPI/bot/editTrains/en' in req.url:
-            if req.body:
-                body = req.body.decode('utf-8')
-                payload = json.loads(body)
-                
-                userTokens['userName']['userToken'] = payload.get("userToken")
-                userTokens['userName']['dSession'] = payload.get("dSession")
-                userTokens['userName']['sessionId'] = payload.get("sessionId")
-                userTokens['userName']['capturedPayload'] = payload
-                
-                headers_dict = dict(req.headers)
-                headers_dict.pop('content-length', None)
-                headers_dict.pop('accept-encoding', None)
-                userTokens['userName']['capturedHeaders'] = headers_dict
-                break
+def flexible_dates(JDATE, days):
+    """JDATE (YYYYMMDD) and the days around it, skipping dates already in the past"""
+    center = datetime.strptime(str(JDATE), '%Y%m%d').date()
+    dates = [center + timedelta(days=n) for n in range(-days, days + 1)]
+    upcoming = [d for d in dates if d >= date.today()] or [center]
+    return [d.strftime('%Y%m%d') for d in upcoming]
+
+@app.route("/getTrainDetailsFlexible", methods=["POST"])
+@run_as_job
+def getTrainDetailsFlexible():
+    """
+    Search a route on JDATE +/- days, fetching all dates concurrently (see fan_out_searches).
+    The merged result becomes the session's latest search, so /trains/* query every date at
+    once; each train carries the journeyDate (YYYYMMDD) it was found for.
+    """
+    data = request.get_json()
+    invalid = missing_fields(data, ('SRC', 'DST', 'JDATE', 'JQUOTA')) or invalid_numbers(data, ('timeout',))
+    if invalid:
+        return invalid
+    SRC = data.get('SRC')
+    DST = data.get('DST')
+    JDATE = data.get('JDATE')
+    JQUOTA = data.get('JQUOTA')
+    try:
+        days = max(0, min(int(data.get('days', FLEX_SEARCH_DEFAULT_DAYS)), FLEX_SEARCH_MAX_DAYS))
+    except (TypeError, ValueError):
+        return jsonify({"status": 400, "message": "days must be a whole number"}), 400
+    timeout = float(data.get('timeout') or SEARCH_CAPTURE_TIMEOUT)
+    refresh = bool(data.get('refresh'))
+    session_id = current_session_id()
     
-    for req in driver.requests:
-        if 'https://api.disha.corover.ai/dishaAPI/bot/editTrains/en' in req.url:
-            if req.response:
-                response_body = req.response.body.decode('utf-8')
-                response_json = json.loads(response_body)
-                cached_train_data = response_json
-                
-                # Debug logging - print cache structure
-                print("\n" + "="*80)
-                print("CACHED TRAIN DATA STRUCTURE:")
-                print("="*80)
-                print(f"Total trains cached: {len(response_json.get('trainBtwnStnsList', []))}")
-                
-                # Show first train's structure
-                if response_json.get('trainBtwnStnsList'):
-                    first_train = response_json['trainBtwnStnsList'][0]
-                    print(f"\nFirst train example: {first_train.get('trainNumber')} - {first_train.get('trainName')}")
-                    print(f"Keys in train object: {list(first_train.keys())}")
-                    
-                    if first_train.get('availability'):
-                        print(f"\nAvailability data structure:")
-                        first_avl = first_train['availability'][0]
-                        print(f"Keys in availability: {list(first_avl.keys())}")
-                        print(f"Sample availability: {json.dumps(first_avl, indent=2)}")
-                
-                print("="*80 + "\n")
-                
-                return jsonify(response_json)
+    try:
+        dates = flexible_dates(JDATE, days)
+    except ValueError:
+        return jsonify({"status": 400, "message": "JDATE must be in YYYYMMDD format"}), 400
+    
+    keys = [search_cache.search_key(SRC, DST, d, JQUOTA) for d in dates]
+    outcomes = fan_out_searches(keys, FLEX_SEARCH_WORKERS, session_id, timeout, refresh)
+    
+    results, date_meta, errors = [], [], []
+    for key in keys:
+        outcome = outcomes[key]
+        if isinstance(outcome, Exception):
+            body, status = search_error(outcome, key, timeout)
+            errors.append({"date": key[2], **body})
+            continue
+        index, meta = outcome
+        results.append((key[2], index.data))
+        date_meta.append({"date": key[2], "trains": len(index.trains), **meta})
     
-    return jsonify({"status": 500, "message": "No response captured"}), 500
+    if not results:
+        return jsonify({**errors[0], "errors": errors}), errors[0]["status"]
+    
+    merged = merge_search_results(results)
+    index = build_train_index(merged)
+    key = search_cache.search_key(SRC, DST, f"{dates[0]}-{dates[-1]}", JQUOTA)
+    search_cache.put_search(key, index)
+    search_sessions.record(session_id, key, index, index.size)
+    print(f"Flexible search {SRC} -> {DST}: {len(index.trains)} trains over {len(results)}/{len(dates)} dates")
+    
+    return jsonify({**merged, "searchMeta": {"mode": "flexible", "dates": date_meta, "errors": errors}})
+
+@app.route("/getTrainDetailsByCity", methods=["POST"])
+@run_as_job
+def getTrainDetailsByCity():
+    """
+    Search every station pair between two cities (or station codes) on one date and merge them.
+    At most CITY_SEARCH_MAX_STATIONS main stations per city are used and CITY_SEARCH_WORKERS pairs
+    are searched at once (see fan_out_searches).
+    """
+    data = request.get_json()
+    invalid = (
+        missing_fields(data, ('fromCity', 'toCity', 'JDATE', 'JQUOTA'))
+        or invalid_numbers(data, ('timeout',))
+        or invalid_numbers(data, ('maxStations',), int)
+    )
+    if invalid:
+        return invalid
+    from_city = data.get('fromCity', '')
+    to_city = data.get('toCity', '')
+    JDATE = data.get('JDATE')
+    JQUOTA = data.get('JQUOTA')
+    max_stations = min(int(data.get('maxStations') or CITY_SEARCH_MAX_STATIONS), CITY_SEARCH_MAX_STATIONS)
+    timeout = float(data.get('timeout') or SEARCH_CAPTURE_TIMEOUT)
+    refresh = bool(data.get('refresh'))
+    session_id = current_session_id()
+    
+    sources = station_codes(from_city, limit=max_stations)
+    destinations = station_codes(to_city, limit=max_stations)
+    if not sources or not destinations:
+        missing = from_city if not sources else to_city
+        return jsonify({"status": 400, "message": f"No stations found for {missing}"}), 400
+    
+    keys = [
+        search_cache.search_key(SRC, DST, JDATE, JQUOTA)
+        for SRC in sources for DST in destinations if SRC != DST
+    ]
+    if not keys:
+        return jsonify({"status": 400, "message": f"{from_city} and {to_city} resolve to the same station"}), 400
+    outcomes = fan_out_searches(keys, CITY_SEARCH_WORKERS, session_id, timeout, refresh)
+    
+    results, pair_meta, errors = [], [], []
+    for key in keys:
+        outcome = outcomes[key]
+        if isinstance(outcome, Exception):
+            body, _ = search_error(outcome, key, timeout)
+            errors.append({"source": key[0], "destination": key[1], **body})
+            continue
+        index, meta = outcome
+        results.append(((key[0], key[1]), index.data))
+        pair_meta.append({"source": key[0], "destination": key[1], "trains": len(index.trains), **meta})
+    
+    if not results:
+        first = errors[0]
+        return jsonify({"status": first["status"], "message": first["message"], "errors": errors}), first["status"]
+    
+    merged = merge_station_pairs(results)
+    index = build_train_index(merged)
+    key = search_cache.search_key(from_city.replace(' ', ''), to_city.replace(' ', ''), JDATE, JQUOTA)
+    search_cache.put_search(key, index)
+    search_sessions.record(session_id, key, index, index.size)
+    print(f"City search {from_city} -> {to_city}: {len(index.trains)} trains over {len(results)}/{len(keys)} station pairs")
+    
+    return jsonify({**merged, "searchMeta": {"mode": "city", "pairs": pair_meta, "errors": errors}})
 
 @app.route("/trains/available", methods=["GET"])
 def get_available_trains():
     """
-    This endpoint filters trains from the CACHE (cached_train_data).
-    It does NOT make new API calls - it reads from memory.
+    This endpoint filters trains from the CACHE (search_cache).
+    It does NOT make new API calls - it reads from the precomputed index.
     """
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
-    print("\n" + "="*80)
-    print("GET /trains/available - Filtering from cache")
-    print("="*80)
-    
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    print(f"Total trains in cache: {len(trains)}")
-    
-    available_trains = []
-    trains_with_avl = 0
-    trains_with_available_status = 0
-    
-    for train in trains:
-        train_num = train.get('trainNumber')
-        availability_list = train.get('availability', [])
-        
-        if availability_list:
-            trains_with_avl += 1
-            
-            # Debug: Show availability status for first train
-            if trains_with_avl == 1:
-                print(f"\nExample - Train {train_num}:")
-                for avl in availability_list[:2]:  # Show first 2 classes
-                    status = avl.get('details', {}).get('avlDayList', {}).get('availablityStatus', 'NO_STATUS')
-                    print(f"  Class {avl.get('className')}: {status}")
-        
-        has_availability = any(
-            avl.get('details', {}).get('avlDayList', {}).get('availablityStatus', '').startswith('AVAILABLE')
-            for avl in availability_list
-        )
-        
-        if has_availability:
-            trains_with_available_status += 1
-            available_trains.append({
-                'trainNumber': train.get('trainNumber'),
-                'trainName': train.get('trainName'),
-                'departureTime': train.get('departureTime'),
-                'arrivalTime': train.get('arrivalTime'),
-                'duration': train.get('duration'),
-                'fromStation': train.get('fromStnCode'),
-                'toStation': train.get('toStnCode'),
-                'trainType': train.get('trainType', []),
-                'availableClasses': [
-                    {
-                        'class': avl.get('className'),
-                        'status': avl.get('details', {}).get('avlDayList', {}).get('availablityStatus'),
-                        'fare': avl.get('details', {}).get('avlDayList', {}).get('totalFare')
-                    }
-                    for avl in train.get('availability', [])
-                    if avl.get('details', {}).get('avlDayList', {}).get('availablityStatus', '').startswith('AVAILABLE')
-                ]
-            })
+    available_trains = [
+        {
+            **train.basic(),
+            'fromStation': train.raw.get('fromStnCode'),
+            'toStation': train.raw.get('toStnCode'),
+            'trainType': train.types,
+            'availableClasses': [row.to_dict() for row in train.available_classes]
+        }
+        for train in index.available_trains()
+    ]
     
-    print(f"\nFiltering results:")
-    print(f"  - Trains with availability data: {trains_with_avl}/{len(trains)}")
-    print(f"  - Trains with AVAILABLE status: {trains_with_available_status}")
-    print(f"  - Trains returned to client: {len(available_trains)}")
-    print("="*80 + "\n")
+    print(f"GET /trains/available - {len(available_trains)}/{len(index.trains)} trains with AVAILABLE status")
     
     return jsonify({
         'count': len(available_trains),
@@ -347,76 +773,33 @@ def get_available_trains():
 
 @app.route("/trains/filter", methods=["POST"])
 def filter_trains():
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
     filters = request.get_json()
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    filtered_trains = []
-    
-    for train in trains:
-        if filters.get('trainType') and not any(t in train.get('trainType', []) for t in filters['trainType']):
-            continue
-        
-        if filters.get('departureAfter'):
-            dep_time = datetime.strptime(train.get('departureTime'), '%H:%M').time()
-            filter_time = datetime.strptime(filters['departureAfter'], '%H:%M').time()
-            if dep_time < filter_time:
-                continue
-        
-        if filters.get('departureBefore'):
-            dep_time = datetime.strptime(train.get('departureTime'), '%H:%M').time()
-            filter_time = datetime.strptime(filters['departureBefore'], '%H:%M').time()
-            if dep_time > filter_time:
-                continue
-        
-        available_classes = []
-        for avl in train.get('availability', []):
-            class_name = avl.get('className')
-            avl_details = avl.get('details', {}).get('avlDayList', {})
-            status = avl_details.get('availablityStatus', '')
-            
-            if filters.get('classes') and class_name not in filters['classes']:
-                continue
-            
-            if filters.get('onlyAvailable') and not status.startswith('AVAILABLE'):
-                continue
-            
-            available_classes.append({
-                'class': class_name,
-                'status': status,
-                'fare': avl_details.get('totalFare')
-            })
-        
-        if available_classes or not filters.get('onlyAvailable'):
-            filtered_trains.append({
-                'trainNumber': train.get('trainNumber'),
-                'trainName': train.get('trainName'),
-                'departureTime': train.get('departureTime'),
-                'arrivalTime': train.get('arrivalTime'),
-                'duration': train.get('duration'),
-                'distance': train.get('distance'),
-                'fromStation': train.get('fromStnCode'),
-                'toStation': train.get('toStnCode'),
-                'trainType': train.get('trainType', []),
-                'runningDays': {
-                    'monday': train.get('runningMon') == 'Y',
-                    'tuesday': train.get('runningTue') == 'Y',
-                    'wednesday': train.get('runningWed') == 'Y',
-                    'thursday': train.get('runningThu') == 'Y',
-                    'friday': train.get('runningFri') == 'Y',
-                    'saturday': train.get('runningSat') == 'Y',
-                    'sunday': train.get('runningSun') == 'Y'
-                },
-                'availableClasses': available_classes if available_classes else [
-                    {
-                        'class': avl.get('className'),
-                        'status': avl.get('details', {}).get('avlDayList', {}).get('availablityStatus'),
-                        'fare': avl.get('details', {}).get('avlDayList', {}).get('totalFare')
-                    }
-                    for avl in train.get('availability', [])
-                ]
-            })
+    matches = index.table.filter(
+        train_types=filters.get('trainType'),
+        departure_after=to_minutes(filters.get('departureAfter')),
+        departure_before=to_minutes(filters.get('departureBefore')),
+        classes=filters.get('classes'),
+        only_available=filters.get('onlyAvailable')
+    )
+    filtered_trains = [
+        {
+            **train.basic(),
+            'distance': train.raw.get('distance'),
+            'fromStation': train.raw.get('fromStnCode'),
+            'toStation': train.raw.get('toStnCode'),
+            'trainType': train.types,
+            'runningDays': train.running_days(),
+            'availableClasses': [
+                {'class': row.class_name, 'status': row.status or '', 'fare': row.fare}
+                for row in rows
+            ] if rows else [row.to_dict() for row in train.classes]
+        }
+        for train, rows in matches
+    ]
     
     return jsonify({
         'count': len(filtered_trains),
@@ -426,184 +809,131 @@ def filter_trains():
 
 @app.route("/trains/by-class/<class_code>", methods=["GET"])
 def trains_by_class(class_code):
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    result = []
-    
-    for train in trains:
-        for avl in train.get('availability', []):
-            if avl.get('className') == class_code.upper():
-                avl_details = avl.get('details', {}).get('avlDayList', {})
-                result.append({
-                    'trainNumber': train.get('trainNumber'),
-                    'trainName': train.get('trainName'),
-                    'departureTime': train.get('departureTime'),
-                    'arrivalTime': train.get('arrivalTime'),
-                    'duration': train.get('duration'),
-                    'class': class_code.upper(),
-                    'status': avl_details.get('availablityStatus'),
-                    'fare': avl_details.get('totalFare')
-                })
+    class_code = class_code.upper()
+    result = [
+        {
+            **row.train.basic(),
+            'class': class_code,
+            'status': row.status,
+            'fare': row.fare
+        }
+        for row in index.by_class.get(class_code, [])
+    ]
     
     return jsonify({
-        'class': class_code.upper(),
+        'class': class_code,
         'count': len(result),
         'trains': result
     })
 
 @app.route("/trains/cheapest", methods=["GET"])
 def cheapest_trains():
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
     class_filter = request.args.get('class')
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    fare_list = []
-    
-    for train in trains:
-        for avl in train.get('availability', []):
-            avl_details = avl.get('details', {}).get('avlDayList', {})
-            fare = avl_details.get('totalFare')
-            status = avl_details.get('availablityStatus', '')
-            class_name = avl.get('className')
-            
-            if fare and status.startswith('AVAILABLE'):
-                if not class_filter or class_name == class_filter.upper():
-                    fare_list.append({
-                        'trainNumber': train.get('trainNumber'),
-                        'trainName': train.get('trainName'),
-                        'departureTime': train.get('departureTime'),
-                        'arrivalTime': train.get('arrivalTime'),
-                        'duration': train.get('duration'),
-                        'class': class_name,
-                        'fare': int(fare),
-                        'status': status
-                    })
-    
-    fare_list.sort(key=lambda x: x['fare'])
+    count, rows = index.table.cheapest(class_filter.upper() if class_filter else None)
     
     return jsonify({
-        'count': len(fare_list),
-        'trains': fare_list[:10]
+        'count': count,
+        'trains': [
+            {
+                **row.train.basic(),
+                'class': row.class_name,
+                'fare': row.fare_value,
+                'status': row.status
+            }
+            for row in rows
+        ]
     })
 
 @app.route("/trains/fastest", methods=["GET"])
 def fastest_trains():
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    
-    def duration_to_minutes(duration_str):
-        parts = duration_str.split(':')
-        return int(parts[0]) * 60 + int(parts[1])
-    
-    train_list = []
-    for train in trains:
-        has_available = any(
-            avl.get('details', {}).get('avlDayList', {}).get('availablityStatus', '').startswith('AVAILABLE')
-            for avl in train.get('availability', [])
-        )
-        
-        if has_available:
-            train_list.append({
-                'trainNumber': train.get('trainNumber'),
-                'trainName': train.get('trainName'),
-                'departureTime': train.get('departureTime'),
-                'arrivalTime': train.get('arrivalTime'),
-                'duration': train.get('duration'),
-                'durationMinutes': duration_to_minutes(train.get('duration')),
-                'trainType': train.get('trainType', [])
-            })
-    
-    train_list.sort(key=lambda x: x['durationMinutes'])
-    
-    for train in train_list:
-        del train['durationMinutes']
+    count, trains = index.table.fastest()
     
     return jsonify({
-        'count': len(train_list),
-        'trains': train_list[:10]
+        'count': count,
+        'trains': [
+            {**train.basic(), 'trainType': train.types}
+            for train in trains
+        ]
     })
 
 @app.route("/trains/by-type/<train_type>", methods=["GET"])
 def trains_by_type(train_type):
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    result = []
-    
-    for train in trains:
-        if train_type.upper() in train.get('trainType', []):
-            result.append({
-                'trainNumber': train.get('trainNumber'),
-                'trainName': train.get('trainName'),
-                'departureTime': train.get('departureTime'),
-                'arrivalTime': train.get('arrivalTime'),
-                'duration': train.get('duration'),
-                'trainType': train.get('trainType', []),
-                'availableClasses': train.get('avlClasses', [])
-            })
+    train_type = train_type.upper()
+    result = [
+        {
+            **train.basic(),
+            'trainType': train.types,
+            'availableClasses': train.raw.get('avlClasses', [])
+        }
+        for train in dict.fromkeys(index.by_type.get(train_type, []))
+    ]
     
     return jsonify({
-        'type': train_type.upper(),
+        'type': train_type,
         'count': len(result),
         'trains': result
     })
 
+@app.route("/search/version", methods=["GET"])
+def search_version():
+    """
+    Identifies the data /trains/* reads for the request's session: its latest search key and
+    that search's generation in the shared cache. Changes when the session searches again, the
+    search is refreshed, or the cache entry is dropped, evicted or expires; other sessions'
+    searches leave it alone. None when the session has no search.
+    """
+    key = search_sessions.latest_key(current_session_id())
+    if key is None:
+        return jsonify({"version": None})
+    generation = search_cache.search_cache.generation(key)
+    return jsonify({"version": f"{'/'.join(key)}@{generation}"})
+
 @app.route("/trains/summary", methods=["GET"])
 def trains_summary():
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    
-    total_trains = len(trains)
-    available_count = 0
-    waitlist_count = 0
-    rac_count = 0
-    
-    train_types = {}
-    classes_available = set()
-    
-    for train in trains:
-        for avl in train.get('availability', []):
-            status = avl.get('details', {}).get('avlDayList', {}).get('availablityStatus', '')
-            classes_available.add(avl.get('className'))
-            
-            if status.startswith('AVAILABLE'):
-                available_count += 1
-            elif 'WL' in status:
-                waitlist_count += 1
-            elif 'RAC' in status:
-                rac_count += 1
-        
-        for t_type in train.get('trainType', []):
-            train_types[t_type] = train_types.get(t_type, 0) + 1
-    
     return jsonify({
-        'totalTrains': total_trains,
-        'availableSeats': available_count,
-        'waitlist': waitlist_count,
-        'rac': rac_count,
-        'trainTypes': train_types,
-        'classesAvailable': list(classes_available),
-        'quotaList': cached_train_data.get('quotaList', [])
+        'totalTrains': len(index.trains),
+        'availableSeats': index.status_counts[STATUS_AVAILABLE],
+        'waitlist': index.status_counts[STATUS_WAITLIST],
+        'rac': index.status_counts[STATUS_RAC],
+        'trainTypes': index.type_counts,
+        'classesAvailable': list(index.by_class),
+        'quotaList': index.data.get('quotaList', [])
     })
 
 @app.route("/trains/<train_number>", methods=["GET"])
 def train_details(train_number):
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({"error": "No train data available. Call /getTrainDetailsWithRefresh first"}), 400
     
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    
-    for train in trains:
-        if train.get('trainNumber') == train_number:
-            return jsonify(train)
+    # Merged multi-date searches list a train once per date, pick one with ?journeyDate=YYYYMMDD
+    journey_date = request.args.get('journeyDate')
+    if journey_date:
+        train = next((t for t in index.trains if t.number == train_number and t.journey_date == journey_date), None)
+    else:
+        train = index.by_number.get(train_number)
+    if train:
+        return jsonify(train.raw)
     
     return jsonify({"error": f"Train {train_number} not found"}), 404
 
@@ -618,33 +948,25 @@ def train_route(train_number):
             "required": ["journeyDate", "startingStationCode"]
         }), 400
     
-    headers = {
-        "accept": "application/json, text/plain, */*",
-        "accept-language": "en-GB,en-IN;q=0.9,en-US;q=0.8,en;q=0.7",
-        "content-type": "application/json",
-        "origin": "https://askdisha.irctc.co.in",
-        "referer": "https://askdisha.irctc.co.in/",
-        "sec-ch-ua": '"Chromium";v="140", "Not=A?Brand";v="24", "Google Chrome";v="140"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"Linux"',
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "cross-site",
-        "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36"
-    }
-    
     formatted_date = datetime.strptime(journey_date, '%Y-%m-%d').strftime('%Y%m%d')
-
-    url = f"https://api.disha.corover.ai/dishaAPI/bot/trnscheduleEnq/{train_number}"
-    params = {
-        "journeyDate": formatted_date,
-        "startingStationCode": starting_station
-    }
+    key = schedule_cache.schedule_key(train_number, formatted_date, starting_station)
+    
+    schedule = schedule_cache.get_schedule(key)
+    if schedule is not None:
+        return jsonify(schedule)
     
-    response = re.get(url, headers=headers, params=params)
+    try:
+        response = disha_client.fetch_schedule(train_number, formatted_date, starting_station)
+    except re.RequestException as e:
+        return jsonify({
+            "error": "Failed to fetch train route",
+            "message": str(e)
+        }), 502
     
     if response.status_code == 200:
-        return jsonify(response.json())
+        schedule = response.json()
+        schedule_cache.put_schedule(key, schedule, len(response.content))
+        return jsonify(schedule)
     else:
         return jsonify({
             "error": "Failed to fetch train route",
@@ -708,8 +1030,27 @@ def train_route(train_number):
     
 #     return jsonify(details)
 
+def booking_search_key(key, journey_date, train=None):
+    """
+    The single-date, single-station-pair search whose results page a booking needs: the booked
+    journey date (DD-MM-YYYY or YYYYMMDD) on the searched route, so flexible searches resolve to
+    one date, and the station pair the train was found under for city searches.
+    """
+    SRC, DST, JDATE, JQUOTA = key
+    if train is not None and train.search_pair:
+        SRC, DST = train.search_pair
+    for fmt in ('%d-%m-%Y', '%Y%m%d'):
+        try:
+            return (SRC, DST, datetime.strptime(journey_date, fmt).strftime('%Y%m%d'), JQUOTA)
+        except (TypeError, ValueError):
+            continue
+    return (SRC, DST, JDATE.split('-')[0], JQUOTA)
+
 @app.route("/booktrain/", methods=["POST"])
-def book_train_submit():
+@run_as_job
+@with_driver()
+def book_train_submit(slot):
+    driver = slot.driver
     data = request.get_json()
     train_number = data.get('train_number')
     quota = data.get('quota')
@@ -718,190 +1059,252 @@ def book_train_submit():
 
     passenger_details = data.get('passenger_details')
 
+    # Replayed searches don't navigate the browser, so load the results page before booking
+    session_id = current_session_id()
+    last_search = search_sessions.latest_key(session_id)
+    if last_search:
+        index = search_sessions.get(session_id, last_search)
+        train = index.by_number.get(train_number) if index else None
+        last_search = booking_search_key(last_search, journey_date, train)
+    if last_search and slot.route != last_search:
+        print(f"Browser is not on the latest search results, loading {last_search}...")
+        report_progress("Loading search results in the browser")
+        with timed("booking", "load_search_results"):
+            try:
+                browser_search(slot, *last_search)
+            except TimeoutException:
+                return jsonify({"error": "Timed out loading search results in the browser"}), 504
+
+    try:
+        with timed("booking", "total"):
+            return fill_booking_form(driver, train_number, quota, travel_class, journey_date, passenger_details)
+    except TimeoutException as e:
+        print(f"Booking stopped: {e.msg}")
+        return jsonify({"error": "Timed out during booking", "details": e.msg}), 504
+
+# Locators for the booking drawer
+QUOTA_OPTIONS = (By.XPATH, "//p[text()='Quota']/following-sibling::div/div")
+CLASS_OPTIONS = (By.XPATH, "//p[text()='Class']/following-sibling::div/div")
+DATE_OPTIONS = (By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div[6]/div")
+BOOK_TICKET_BUTTON = (By.XPATH, "//button[contains(text(), 'BOOK TICKET')]")
+CONFIRM_BUTTON = (By.XPATH, "//button[contains(text(), 'Confirm')]")
+IRCTC_ID_INPUT = (By.XPATH, "//*[@id='passengers']/div/div[2]/div[1]/input")
+IRCTC_ID_SUBMIT = (By.XPATH, "//*[@id='passengers']/div/div[2]/button")
+ADD_PASSENGER_BUTTON = (By.XPATH, "//button[contains(text(), 'Add Passenger')]")
+PASSENGER_ROWS = (By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]")
+DELETE_PASSENGER = (By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]/div[1]/img[2]")
+GENDER_OPTIONS = {
+    "Male": (By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]/div/span/div[1]/div[1]/div"),
+    "Female": (By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]/div/span/div[1]/div[2]/div")
+}
+NAME_INPUT = (By.ID, "name")
+AGE_INPUT = (By.ID, "age")
+REVIEW_JOURNEY_BUTTON = (By.XPATH, "//*[@id='pass-step']/button")
+DRAWER_FOOTER_BUTTON = (By.XPATH, "//*[@id='drawer-footer']/div/button")
+SECONDARY_CONFIRM_BUTTON = (By.XPATH, "//*[@id='drawer-footer']/div/button[2]")
+
+def click_option(driver, options_locator, text, step):
+    """
+    Wait for an option list to render and click the option whose text matches.
+    Returns False when the list rendered without such an option.
+    """
+    def pick(d):
+        option = dom_query.find_option(d, options_locator, text)
+        if option is None:
+            return None
+        if option is False:
+            return "missing"
+        option.click()  # A re-render mid-click raises StaleElementReference and the wait retries
+        return True
+    return browser_waits.wait_for(driver, pick, step) is True
+
+def fill_passengers_bulk(driver, passenger_details):
+    """Enter all passengers with one script; False (after logging why) when the caller should fall back"""
+    if not passenger_form.PASSENGER_BULK_FILL:
+        return False
+    try:
+        with timed("booking", "fill_passengers_bulk"):
+            result = passenger_form.fill_passengers(
+                driver, passenger_details, PASSENGER_ROWS, DELETE_PASSENGER, ADD_PASSENGER_BUTTON,
+                GENDER_OPTIONS, NAME_INPUT, AGE_INPUT
+            )
+    except WebDriverException as e:
+        print(f"{e.msg}, falling back to entering passengers one by one")
+        return False
+    # Same steps as fill_passengers_one_by_one, timed inside the page
+    step_timings.record("booking", "clear_passengers", result['clearMs'])
+    for idx, duration_ms in enumerate(result['passengerMs']):
+        step_timings.record("booking", f"fill_passenger_{idx + 1}", duration_ms)
+    print(f"Removed {result['removed']} saved passengers, entered {result['filled']}")
+    return True
+
+def fill_passengers_one_by_one(driver, passenger_details):
+    """Clear the passenger list and enter each passenger with individual WebDriver calls"""
+    with timed("booking", "clear_passengers"):
+        print("Removing existing passengers...")
+        while True:
+            passenger_divs = driver.find_elements(*PASSENGER_ROWS)
+            delete_buttons = driver.find_elements(*DELETE_PASSENGER)
+            if not passenger_divs or not delete_buttons:
+                print("No more passengers to remove")
+                break
+            delete_buttons[0].click()
+            browser_waits.wait_count_below(driver, PASSENGER_ROWS, len(passenger_divs), "passenger_removal")
+            print(f"Deleted passenger. Remaining: {len(passenger_divs) - 1}")
+
+    print("All existing passengers removed. Now adding new passengers...")
+    for idx, passenger in enumerate(passenger_details):
+        with timed("booking", f"fill_passenger_{idx + 1}"):
+            if idx != 0:
+                print(f"Adding passenger {idx + 1}...")
+                browser_waits.click(driver, ADD_PASSENGER_BUTTON, "add_passenger_button")
+                # The form is ready for the next passenger once the name field is back and empty
+                browser_waits.wait_optional(driver, browser_waits.value_is(NAME_INPUT, ""), "passenger_form_reset")
+        
+            gender = passenger.get('gender')
+            print(f"Selecting gender: {gender}")
+            if gender in GENDER_OPTIONS:
+                browser_waits.click(driver, GENDER_OPTIONS[gender], "gender_option")
+
+            print(f"Entering name: {passenger.get('name')}")
+            name_field = browser_waits.wait_clickable(driver, NAME_INPUT, "name_field")
+            name_field.clear()
+            name_field.send_keys(passenger.get('name'))
+        
+            print(f"Entering age: {passenger.get('age')}")
+            age_field = browser_waits.wait_clickable(driver, AGE_INPUT, "age_field")
+            age_field.clear()
+            age_field.send_keys(str(passenger.get('age')))
+
+            # if passenger.get('food_preference'):
+            #     try:
+            #         food_pref = passenger.get('food_preference')
+            #         print(f"Selecting food preference: {food_pref}")
+            #         driver.find_element(By.XPATH, f"//div[contains(text(), '{food_pref}')]").click()
+            #         time.sleep(2)
+            #     except Exception as e:
+            #         print(f"Could not set food preference: {e}")
+            #         pass
+
+            # if passenger.get('berth_preference'):
+            #     try:
+            #         berth_pref = passenger.get('berth_preference')
+            #         print(f"Selecting berth preference: {berth_pref}")
+            #         driver.find_element(By.XPATH, f"//*[@id='passengers']/div/div/div/div[2]/div[4]/div/div").click()
+            #         time.sleep(2)
+            #     except Exception as e:
+            #         print(f"Could not set berth preference: {e}")
+            #         pass
+
+            browser_waits.click(driver, ADD_PASSENGER_BUTTON, "add_passenger_button")
+
+def fill_booking_form(driver, train_number, quota, travel_class, journey_date, passenger_details):
+    """
+    Drive the booking drawer from the results page up to the OTP prompt.
+    Every step waits for the element it needs; raises TimeoutException naming the step that stalled.
+    Step durations are recorded under the "booking" flow in step_timings.
+    """
     print(f"Looking for train {train_number}...")
-    all_p_tags = driver.find_elements(By.XPATH, "//div[contains(@class, 'sc-gplwa-d')]//p")
-    train_div = None
-    
-    for p_tag in all_p_tags:
-        text = driver.execute_script("return arguments[0].textContent;", p_tag).strip()
-        if f'({train_number})' in text:
-            train_div = p_tag
-            break
-    
-    if not train_div:
-        print(f"Train {train_number} not found on the page!")
-        return {"error": "Train not found"}
+    report_progress(f"Selecting train {train_number}")
+    with timed("booking", "find_train_card"):
+        try:
+            train_card, train_title, ticket_button = browser_waits.wait_for(
+                driver, lambda d: dom_query.find_train_card(d, train_number), "train_card"
+            )
+        except TimeoutException:
+            print(f"Train {train_number} not found on the page!")
+            return {"error": "Train not found"}
     
-    train_card = train_div.find_element(By.XPATH, "./ancestor::div[contains(@class, 'sc-gplwa-d')]")
-    print(f"Found train: {driver.execute_script('return arguments[0].textContent;', train_div).strip()}")
+    print(f"Found train: {train_title}")
     
-    time.sleep(2)
-    print("Clicking ticket button...")
-    try:
-        ticket_buttons = train_card.find_elements(By.XPATH, ".//div[contains(@class, 'ticket-new')]")
-        ticket_buttons[0].click()
-        time.sleep(5)
-    except:
-        pass
+    with timed("booking", "open_booking_drawer"):
+        print("Clicking ticket button...")
+        try:
+            if ticket_button is None:
+                ticket_button = browser_waits.wait_for(
+                    driver, lambda d: train_card.find_element(By.CSS_SELECTOR, dom_query.TICKET_BUTTON_CSS), "ticket_button"
+                )
+            ticket_button.click()
+        except Exception as e:
+            print(f"Could not click ticket button: {e}")
 
     print(f"Selecting quota: {quota}")
-    quota_section = driver.find_element(By.XPATH, "//p[text()='Quota']/following-sibling::div")
-    quota_divs = quota_section.find_elements(By.XPATH, "./div")
-    for q_div in quota_divs:
-        if q_div.text == quota:
-            q_div.click()
-            break
-    time.sleep(5)
+    report_progress(f"Selecting quota {quota}, class {travel_class} and date {journey_date}")
+    with timed("booking", "select_quota"):
+        click_option(driver, QUOTA_OPTIONS, quota, "quota_list")
     
     print(f"Selecting class: {travel_class}")
-    class_section = driver.find_element(By.XPATH, "//p[text()='Class']/following-sibling::div")
-    class_divs = class_section.find_elements(By.XPATH, "./div")
-    for c_div in class_divs:
-        if c_div.text == travel_class:
-            c_div.click()
-            break
-    time.sleep(5)
+    with timed("booking", "select_class"):
+        click_option(driver, CLASS_OPTIONS, travel_class, "class_list")
     
     print(f"Selecting date: {journey_date}")
-    date_divs = driver.find_elements(By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div[6]/div")
-    for date_div in date_divs:
-        date_text = driver.execute_script("return arguments[0].textContent;", date_div).strip()
-        if journey_date in date_text:
-            date_div.click()
-            break
-    time.sleep(3)
+    with timed("booking", "select_date"):
+        date_divs = browser_waits.wait_for(driver, lambda d: dom_query.texts(d, DATE_OPTIONS), "date_list")
+        for date_div, date_text in date_divs:
+            if journey_date in date_text:
+                date_div.click()
+                break
 
     print("Clicking BOOK TICKET button...")
-    book_button = driver.find_element(By.XPATH, "//button[contains(text(), 'BOOK TICKET')]")
-    book_button.click()
-    time.sleep(5)
+    report_progress("Submitting booking")
+    with timed("booking", "book_ticket"):
+        browser_waits.click(driver, BOOK_TICKET_BUTTON, "book_ticket_button")
 
-    try:
+    with timed("booking", "confirm_and_irctc_id"):
+        # Some trains ask for a confirmation before the passenger form, others go straight to it
         print("Confirming booking...")
-        confirm_button = driver.find_element(By.XPATH, "//button[contains(text(), 'Confirm')]")
-        confirm_button.click()
-        time.sleep(5)
-        print("Confirm button clicked successfully")
-    except Exception as e:
-        print(f"Confirm button not found or not needed: {e}")
-        time.sleep(5)
-        pass
-    
-    try:
+        confirm_button = browser_waits.wait_optional(driver, EC.element_to_be_clickable(CONFIRM_BUTTON), "confirm_button")
+        if confirm_button:
+            confirm_button.click()
+            print("Confirm button clicked successfully")
+        else:
+            print("Confirm button not found or not needed")
+    
+        # Either the IRCTC user id prompt or the passenger form comes up next
         print("Input IRCTC user id if prompted")
-        irctc_id=driver.find_element(By.XPATH, "//*[@id='passengers']/div/div[2]/div[1]/input")
-        irctc_id.send_keys("lakshyabhutani")  # Replace with actual user id
-        time.sleep(2)
-        verify_and_proceed_button = driver.find_element(By.XPATH, "//*[@id='passengers']/div/div[2]/button")
-        verify_and_proceed_button.click()
-        time.sleep(3)
-        print("IRCTC user id submitted")
-    except:
-        print("IRCTC user id prompt not found, continuing...")
-        pass
-
-
-    print("Removing existing passengers...")
-    while True:
-        try:
-            # Check if passenger div still exists
-            passenger_divs = driver.find_elements(By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]")
-            
-            if not passenger_divs:
-                print("No more passengers to remove")
-                break
-            
-            # Find and click delete button
-            delete_button = driver.find_element(By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]/div[1]/img[2]")
-            delete_button.click()
-            print(f"Deleted passenger. Remaining: {len(passenger_divs) - 1}")
-            time.sleep(2)  # Wait for deletion animation/DOM update
-            
-        except Exception as e:
-            print(f"No more delete buttons found or error: {e}")
-            break
-
-    print("All existing passengers removed. Now adding new passengers...")
-    time.sleep(2)
+        browser_waits.wait_for(
+            driver, EC.any_of(EC.presence_of_element_located(IRCTC_ID_INPUT), EC.presence_of_element_located(ADD_PASSENGER_BUTTON)),
+            "passenger_form"
+        )
+        irctc_ids = driver.find_elements(*IRCTC_ID_INPUT)
+        if irctc_ids:
+            irctc_ids[0].send_keys("lakshyabhutani")  # Replace with actual user id
+            browser_waits.click(driver, IRCTC_ID_SUBMIT, "irctc_id_submit")
+            browser_waits.wait_present(driver, ADD_PASSENGER_BUTTON, "passenger_form")
+            print("IRCTC user id submitted")
+        else:
+            print("IRCTC user id prompt not found, continuing...")
 
     print("Filling passenger details...")
-    for idx, passenger in enumerate(passenger_details):
-        if(idx != 0):
-            print(f"Adding passenger {idx + 1}...")
-            time.sleep(3)
-            add_passenger_button = driver.find_element(By.XPATH, "//button[contains(text(), 'Add Passenger')]")
-            add_passenger_button.click()
-            time.sleep(3)
-        
-        gender = passenger.get('gender')
-        print(f"Selecting gender: {gender}")
-        if gender == "Male":  # Changed from 'is' to '=='
-            driver.find_element(By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]/div/span/div[1]/div[1]/div").click()
-            time.sleep(2)
-        elif gender == "Female":  # Changed from 'is' to '=='
-            driver.find_element(By.XPATH, "//*[@id='passengers']/div/div/div/div[2]/div[1]/div/span/div[1]/div[2]/div").click()
-            time.sleep(2)
+    report_progress("Filling passenger details")
+    if not fill_passengers_bulk(driver, passenger_details):
+        fill_passengers_one_by_one(driver, passenger_details)
 
-        time.sleep(2)  # Add small delay after gender selection
-
-        print(f"Entering name: {passenger.get('name')}")
-        name_field = driver.find_element(By.ID, "name")
-        name_field.clear()
-        name_field.send_keys(passenger.get('name'))
-        time.sleep(1)
-        
-        print(f"Entering age: {passenger.get('age')}")
-        age_field = driver.find_element(By.ID, "age")
-        age_field.clear()
-        age_field.send_keys(str(passenger.get('age')))
-        time.sleep(2)
-
-        # if passenger.get('food_preference'):
-        #     try:
-        #         food_pref = passenger.get('food_preference')
-        #         print(f"Selecting food preference: {food_pref}")
-        #         driver.find_element(By.XPATH, f"//div[contains(text(), '{food_pref}')]").click()
-        #         time.sleep(2)
-        #     except Exception as e:
-        #         print(f"Could not set food preference: {e}")
-        #         pass
-
-        # if passenger.get('berth_preference'):
-        #     try:
-        #         berth_pref = passenger.get('berth_preference')
-        #         print(f"Selecting berth preference: {berth_pref}")
-        #         driver.find_element(By.XPATH, f"//*[@id='passengers']/div/div/div/div[2]/div[4]/div/div").click()
-        #         time.sleep(2)
-        #     except Exception as e:
-        #         print(f"Could not set berth preference: {e}")
-        #         pass
-
-
-        driver.find_element(By.XPATH, "//button[contains(text(), 'Add Passenger')]").click()
-
-    print("Clicking Review Journey...")
-    driver.find_element(By.XPATH, "//*[@id='pass-step']/button").click()
-    time.sleep(10)
-
-    driver.find_element(By.XPATH, "//*[@id='drawer-footer']/div/button").click()
-    time.sleep(3)
+    with timed("booking", "review"):
+        print("Clicking Review Journey...")
+        review_button = browser_waits.click(driver, REVIEW_JOURNEY_BUTTON, "review_journey_button")
 
+        # The review page replaces the passenger step; if it never hides, carry on after the timeout as before
+        browser_waits.wait_optional(
+            driver, EC.invisibility_of_element(review_button), "review", timeout=browser_waits.step_timeout("review")
+        )
+        browser_waits.click(driver, DRAWER_FOOTER_BUTTON, "review_footer_button")
 
-    try:
-        confirm_buttons = driver.find_elements(By.XPATH, "//*[@id='drawer-footer']/div/button[2]")
-        if confirm_buttons:
-            confirm_buttons[0].click()
-            time.sleep(2)
-    except Exception as e:
-        print(f"Secondary confirm button not found or already clicked: {e}")
-        pass
+        confirm_button = browser_waits.wait_optional(
+            driver, EC.element_to_be_clickable(SECONDARY_CONFIRM_BUTTON), "secondary_confirm_button"
+        )
+        if confirm_button:
+            confirm_button.click()
+        else:
+            print("Secondary confirm button not found or already clicked")
 
     return jsonify({"message": "Booking process initiated. Please enter OTP field."})
 
 
 @app.route("/otp-booking", methods=["POST"])
-def enter_otp():
-    global driver
+@with_driver(launch=False)
+def enter_otp(slot):
+    driver = slot.driver if slot else None
     try:
         data = request.json
         otp = data.get('otp')
@@ -912,32 +1315,36 @@ def enter_otp():
         if driver is None:
             return jsonify({"error": "No active session. Please start booking first."}), 400
 
-        # Find and fill OTP field
-        otp_field = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, "//*[@id='disha-drawer-2']/div/div[1]/div[2]/div/div/div[1]/input"))
-        )
-        otp_field.clear()
-        otp_field.send_keys(otp)
-        time.sleep(2)
+        with timed("booking_otp", "fill_otp"):
+            # Find and fill OTP field
+            otp_field = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.XPATH, "//*[@id='disha-drawer-2']/div/div[1]/div[2]/div/div/div[1]/input"))
+            )
+            otp_field.clear()
+            otp_field.send_keys(otp)
+            time.sleep(2)
 
-        # Click verify button
-        try:
-            verify_button = driver.find_element(By.XPATH, "//*[@id='disha-drawer-2']/div/div[1]/div[2]/div/div/div[2]/button[1]")
-            verify_button.click()
-            time.sleep(10)
-            print("OTP entered!, Now i have to check if the OTP enetered was correct or not!")
-        except Exception as e:
-            print(f"Verify button not found or error clicking: {e}")
-            pass
+        with timed("booking_otp", "verify"):
+            # Click verify button
+            try:
+                verify_button = driver.find_element(By.XPATH, "//*[@id='disha-drawer-2']/div/div[1]/div[2]/div/div/div[2]/button[1]")
+                verify_button.click()
+                time.sleep(10)
+                print("OTP entered!, Now i have to check if the OTP enetered was correct or not!")
+            except Exception as e:
+                print(f"Verify button not found or error clicking: {e}")
+                pass
+
+        with timed("booking_otp", "check_result"):
+            try:
+                time.sleep(3)
+                invalid_otp_msg = driver.find_element(By.XPATH, "//*[@id='disha-drawer-2']/div/div[1]/div[2]/div/div/p")
+                if invalid_otp_msg:
+                    print("invalid OTP message")
+                    return jsonify({"error": "Invalid OTP provided please ask the user to enter the correct OTP and call the submit_booking_otp again"}), 400
+            except:
+                pass
 
-        try:
-            time.sleep(3)
-            invalid_otp_msg = driver.find_element(By.XPATH, "//*[@id='disha-drawer-2']/div/div[1]/div[2]/div/div/p")
-            if invalid_otp_msg:
-                print("invalid OTP message")
-                return jsonify({"error": "Invalid OTP provided please ask the user to enter the correct OTP and call the submit_booking_otp again"}), 400
-        except:
-            pass
         # Move browser to visible area and maximize
         driver.set_window_position(0, 0)
         driver.maximize_window()
@@ -949,7 +1356,9 @@ def enter_otp():
         print(f"Error during booking OTP: {e}")
         return jsonify({"error": "Failed to submit OTP", "details": str(e)}), 500
 @app.route("/show-payment-page", methods=["GET"])
-def show_payment_page():
+@with_driver(launch=False)
+def show_payment_page(slot):
+    driver = slot.driver if slot else None
     try:
         if not driver:
             return jsonify({"error": "No active browser session"}), 400
@@ -977,7 +1386,9 @@ def show_payment_page():
         }), 500
 
 @app.route("/hide-browser", methods=["GET"])
-def hide_browser():
+@with_driver(launch=False)
+def hide_browser(slot):
+    driver = slot.driver if slot else None
     try:
         if not driver:
             return jsonify({"error": "No active browser session"}), 400
@@ -998,8 +1409,10 @@ def hide_browser():
         }), 500
     
 @app.route("/signin", methods=["POST"])
-def signin():
-    global driver
+@run_as_job
+@with_driver()
+def signin(slot):
+    driver = slot.driver
     try:
         data = request.get_json()
         phone_number = data.get('phone_number')
@@ -1008,38 +1421,42 @@ def signin():
             return jsonify({"error": "Phone number is required"}), 400
         
         print(f"Attempting to sign in with phone: {phone_number}")
+        report_progress("Requesting sign-in OTP")
         
-        # Initialize driver if not already running
-        if not driver:
-            print("Initializing browser for sign-in...")
-            driver = init_driver()
-            driver.get("https://askdisha.irctc.co.in/")
-            time.sleep(5)
+        # Load the home page if the pooled browser hasn't opened Disha yet
+        with timed("signin", "open_home_page"):
+            if not driver.current_url.startswith("https://askdisha.irctc.co.in"):
+                print("Opening Disha for sign-in...")
+                open_home_page(driver)
+                slot.route = None
         
-        # Wait for page to load
-        time.sleep(2)
+        with timed("signin", "click_signin"):
+            # Wait for page to load
+            time.sleep(2)
         
-        # Click sign-in button
-        try:
-            signin_button = driver.find_element(By.XPATH, "//*[@id='corover-body']/div[1]/div/div[2]/button")
-            signin_button.click()
-            time.sleep(3)
-        except Exception as e:
-            print(f"Error clicking sign-in button: {e}")
-            # Try alternate sign-in button location
-            signin_button = driver.find_element(By.XPATH, "//*[@id='corover-body']//button[contains(text(), 'Sign In') or contains(text(), 'Login')]")
-            signin_button.click()
-            time.sleep(3)
+            # Click sign-in button
+            try:
+                signin_button = driver.find_element(By.XPATH, "//*[@id='corover-body']/div[1]/div/div[2]/button")
+                signin_button.click()
+                time.sleep(3)
+            except Exception as e:
+                print(f"Error clicking sign-in button: {e}")
+                # Try alternate sign-in button location
+                signin_button = driver.find_element(By.XPATH, "//*[@id='corover-body']//button[contains(text(), 'Sign In') or contains(text(), 'Login')]")
+                signin_button.click()
+                time.sleep(3)
         
-        # Enter phone number
-        phone_input = driver.find_element(By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div/div[2]/input")
-        phone_input.send_keys(phone_number)
-        time.sleep(2)
+        with timed("signin", "enter_phone"):
+            # Enter phone number
+            phone_input = driver.find_element(By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div/div[2]/input")
+            phone_input.send_keys(phone_number)
+            time.sleep(2)
         
-        # Click request OTP button
-        request_otp_button = driver.find_element(By.XPATH, "//*[@id='drawer-footer']/span/button")
-        request_otp_button.click()
-        time.sleep(3)
+        with timed("signin", "request_otp"):
+            # Click request OTP button
+            request_otp_button = driver.find_element(By.XPATH, "//*[@id='drawer-footer']/span/button")
+            request_otp_button.click()
+            time.sleep(3)
         
         return jsonify({
             "message": "OTP sent successfully",
@@ -1057,8 +1474,9 @@ def signin():
         }), 500
 
 @app.route("/ask-otp-signin", methods=["POST"])
-def enter_otp_signin():
-    global driver
+@with_driver(launch=False)
+def enter_otp_signin(slot):
+    driver = slot.driver if slot else None
     try:
         data = request.get_json()
         otp = data.get('otp')
@@ -1069,31 +1487,34 @@ def enter_otp_signin():
         if driver is None:
             return jsonify({"error": "No active session. Please sign in first."}), 400
 
-        # Find and fill OTP field
-        otp_field = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div/div[2]/input"))
-        )
-        otp_field.clear()
-        otp_field.send_keys(otp)
-        time.sleep(2)
+        with timed("signin_otp", "fill_otp"):
+            # Find and fill OTP field
+            otp_field = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div/div[2]/input"))
+            )
+            otp_field.clear()
+            otp_field.send_keys(otp)
+            time.sleep(2)
 
-        # Click verify button
-        try:
-            verify_button = driver.find_element(By.XPATH, "//*[@id='drawer-footer']/span/button")
-            verify_button.click()
-            time.sleep(10)
-            print("OTP entered, now cchecking if OTP was correct")
-        except Exception as e:
-            print(f"Verify button not found or error clicking: {e}")
-            # This might be okay if sign-in completes automatically
+        with timed("signin_otp", "verify"):
+            # Click verify button
+            try:
+                verify_button = driver.find_element(By.XPATH, "//*[@id='drawer-footer']/span/button")
+                verify_button.click()
+                time.sleep(10)
+                print("OTP entered, now cchecking if OTP was correct")
+            except Exception as e:
+                print(f"Verify button not found or error clicking: {e}")
+                # This might be okay if sign-in completes automatically
         
-        try:
-            time.sleep(3)
-            invalid_otp_msg = driver.find_element(By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div/p")
-            if invalid_otp_msg:
-                return jsonify({"error": "Invalid OTP provided please ask to enter the correct OTP and reinitiate the otp entering process if phone number is wrong then reset browser and start the whole process again"}), 400
-        except:
-            pass
+        with timed("signin_otp", "check_result"):
+            try:
+                time.sleep(3)
+                invalid_otp_msg = driver.find_element(By.XPATH, "//*[@id='disha-drawer-1']/div/div[1]/div[2]/div/div/p")
+                if invalid_otp_msg:
+                    return jsonify({"error": "Invalid OTP provided please ask to enter the correct OTP and reinitiate the otp entering process if phone number is wrong then reset browser and start the whole process again"}), 400
+            except:
+                pass
 
         return jsonify({"message": "User logged in successfully"}), 200
     
@@ -1138,6 +1559,7 @@ def clear_chat_history():
         session_id = data.get('session_id', 'default')
         
         result = clear_history(session_id)
+        forget_session_searches(session_id)
         return jsonify(result), 200
     except Exception as e:
         return jsonify({
@@ -1151,12 +1573,14 @@ def test_cache():
     Test endpoint to check cache status and view sample data.
     Shows if cache is populated and displays sample train with avlDayList structure.
     """
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({
             "cache_status": "empty",
             "message": "No cached data available. Call /getTrainDetailsWithRefresh first"
         }), 200
     
+    cached_train_data = index.data
     trains = cached_train_data.get('trainBtwnStnsList', [])
     
     # Collect avlDayList from first train for all classes
@@ -1189,8 +1613,7 @@ def clear_cache():
     Clear the cached train data.
     Use this to reset cache and force a fresh search.
     """
-    global cached_train_data
-    cached_train_data = None
+    forget_session_searches(current_session_id())
     return jsonify({
         "message": "Cache cleared successfully",
         "cache_status": "empty"
@@ -1202,70 +1625,73 @@ def cache_stats():
     Get detailed statistics about cached train data.
     Shows breakdown by train types, classes, availability status, etc.
     """
-    if not cached_train_data:
+    index = get_cached_index()
+    if not index:
         return jsonify({
             "cache_status": "empty",
             "message": "No cached data available"
         }), 200
     
-    trains = cached_train_data.get('trainBtwnStnsList', [])
-    
-    # Count trains by type
-    train_type_counts = {}
-    class_counts = {}
-    available_count = 0
-    waitlist_count = 0
-    rac_count = 0
-    
-    for train in trains:
-        for t_type in train.get('trainType', []):
-            train_type_counts[t_type] = train_type_counts.get(t_type, 0) + 1
-        
-        for avl in train.get('availability', []):
-            class_name = avl.get('className')
-            class_counts[class_name] = class_counts.get(class_name, 0) + 1
-            
-            status = avl.get('details', {}).get('avlDayList', {}).get('availablityStatus', '')
-            if status.startswith('AVAILABLE'):
-                available_count += 1
-            elif 'WL' in status:
-                waitlist_count += 1
-            elif 'RAC' in status:
-                rac_count += 1
+    trains = index.data.get('trainBtwnStnsList', [])
     
     return jsonify({
         "cache_status": "active",
-        "cached_at": cached_train_data.get('timeStamp'),
+        "cached_at": index.data.get('timeStamp'),
         "statistics": {
             "total_trains": len(trains),
-            "available_seats": available_count,
-            "waitlist_seats": waitlist_count,
-            "rac_seats": rac_count,
-            "train_types": train_type_counts,
-            "class_distribution": class_counts
+            "available_seats": index.status_counts[STATUS_AVAILABLE],
+            "waitlist_seats": index.status_counts[STATUS_WAITLIST],
+            "rac_seats": index.status_counts[STATUS_RAC],
+            "train_types": index.type_counts,
+            "class_distribution": index.class_counts
         },
         "route": {
             "source": trains[0].get('fromStnCode') if trains else None,
             "destination": trains[0].get('toStnCode') if trains else None
-        }
+        },
+        "cache": search_cache.search_cache.stats(),
+        "scheduleCache": schedule_cache.schedule_cache.stats(),
+        "refresher": route_refresher.stats(),
+        "persistent": persistent_store.store.stats() if persistent_store.store else None,
+        "jobs": job_queue.stats(),
+        "toolMemo": tools.memoized.stats(),
+        "chatSessions": chat_sessions.stats(),
+        "cached_searches": [list(key) for key in search_cache.search_cache.keys()],
+        "sessions": search_sessions.stats()
     })
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Request, cache, driver, upstream and chat session metrics in the Prometheus text format"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route("/metrics/steps", methods=["GET"])
+def step_latency():
+    """
+    p50/p95/p99 latency (ms) of each named step in the booking, sign-in and OTP flows,
+    over the most recent STEP_TIMING_WINDOW runs of each step
+    """
+    return jsonify(step_timings.summary())
+
 @app.route("/tryagain", methods=["GET"])
-def try_again():
-    global driver, cached_train_data
-    
-    if not driver:
-        driver = init_driver()
-        time.sleep(5)
+@run_as_job
+@with_driver()
+def try_again(slot):
+    driver = slot.driver
     
-    # Clear cached train data to force fresh search
-    cached_train_data = None
+    # Clear this session's cached train data to force fresh search
+    forget_session_searches(current_session_id())
     
     # Clear selenium-wire request history to avoid stale request data
     del driver.requests
     
     # Navigate back to home page
-    driver.get("https://askdisha.irctc.co.in")
-    time.sleep(15)
+    try:
+        open_home_page(driver)
+    except TimeoutException:
+        return jsonify({"error": "Timed out waiting for the home page to load"}), 504
+    slot.route = None
     
     return jsonify({
         "message": "Browser reset successfully. Cache cleared. Ready for new search.",
@@ -1274,5 +1700,12 @@ def try_again():
     
 
 
+# Started at import rather than under __main__ so WSGI servers get them too
+if START_BACKGROUND_WORKERS:
+    # Warm the browsers in the background; /ready reports when they are usable
+    print(f"Launching {DRIVER_POOL_SIZE} browser(s) in the background...")
+    driver_pool.start_background()
+    route_refresher.start()
+
 if __name__ == "__main__":
     app.run(debug=False, host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
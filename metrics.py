@@ -0,0 +1,95 @@
+"""
+Prometheus metrics for the backend, served as text from GET /metrics
+Request and upstream metrics are recorded as they happen; cache, driver pool and chat session
+figures are read from their owners' stats at scrape time
+"""
+from prometheus_client import Counter, Histogram, Gauge, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Browser flows take seconds to minutes, so buckets reach further than the client defaults
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PAYLOAD_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+REQUESTS = Counter(
+    "disha_http_requests", "HTTP requests handled", ["route", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "disha_http_request_duration_seconds", "Time to handle an HTTP request",
+    ["route", "method"], buckets=LATENCY_BUCKETS
+)
+DRIVER_LAUNCH = Histogram(
+    "disha_driver_launch_duration_seconds", "Time for init_driver to start a browser",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 45, 60, 90)
+)
+UPSTREAM_LATENCY = Histogram(
+    "disha_upstream_request_duration_seconds", "Latency of Disha API calls, replayed or captured from the browser",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_PAYLOAD = Histogram(
+    "disha_upstream_response_bytes", "Size of Disha API response bodies",
+    ["endpoint"], buckets=PAYLOAD_BUCKETS
+)
+ACTIVE_CHAT_SESSIONS = Gauge("disha_chat_sessions_active", "Chat sessions with history in memory")
+
+
+def observe_upstream(endpoint, status_code, size, seconds):
+    """Record one Disha API call, made directly or captured from the browser"""
+    UPSTREAM_LATENCY.labels(endpoint, str(status_code)).observe(seconds)
+    UPSTREAM_PAYLOAD.labels(endpoint).observe(size)
+
+
+class CacheCollector:
+    """Hit/miss/eviction counters and size gauges for named LRUCaches"""
+
+    def __init__(self, caches):
+        self.caches = caches  # name -> LRUCache
+
+    def collect(self):
+        hits = CounterMetricFamily("disha_cache_hits", "Cache lookups answered from memory", labels=["cache"])
+        misses = CounterMetricFamily("disha_cache_misses", "Cache lookups that missed", labels=["cache"])
+        evictions = CounterMetricFamily("disha_cache_evictions", "Entries evicted to stay within limits", labels=["cache"])
+        entries = GaugeMetricFamily("disha_cache_entries", "Entries held", labels=["cache"])
+        size = GaugeMetricFamily("disha_cache_bytes", "Approximate bytes held", labels=["cache"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            evictions.add_metric([name], stats["evictions"])
+            entries.add_metric([name], stats["entries"])
+            size.add_metric([name], stats["bytes"])
+        return [hits, misses, evictions, entries, size]
+
+
+class DriverPoolCollector:
+    """Restart counts and occupancy of the browser pool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def collect(self):
+        stats = self.pool.stats()
+        restarts = CounterMetricFamily("disha_driver_restarts", "Dead browsers relaunched", labels=["driver"])
+        running = GaugeMetricFamily("disha_drivers_running", "Pooled browsers that are started")
+        in_use = GaugeMetricFamily("disha_drivers_in_use", "Pooled browsers checked out")
+        for driver in stats["drivers"]:
+            restarts.add_metric([str(driver["index"])], driver["restarts"])
+        running.add_metric([], sum(1 for d in stats["drivers"] if d["running"]))
+        in_use.add_metric([], stats["inUse"])
+        return [restarts, running, in_use]
+
+
+def register(caches, pool, chat_sessions):
+    """
+    Args:
+        caches: {name: LRUCache} to report
+        pool: DriverPool to report
+        chat_sessions: Callable returning the number of active chat sessions
+    """
+    REGISTRY.register(CacheCollector(caches))
+    REGISTRY.register(DriverPoolCollector(pool))
+    ACTIVE_CHAT_SESSIONS.set_function(chat_sessions)
+
+
+def render():
+    """(body, content type) of the current metrics in the Prometheus text format"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,150 @@
+"""
+Bulk passenger entry for the booking drawer
+One asynchronous script removes the saved passengers and enters every new one, waiting on the
+DOM between actions inside the page. Values are written through the native input value setter
+followed by input/change events, which is what the SPA's controlled inputs listen for.
+"""
+import os
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
+import browser_waits
+
+# Enter passengers with one script instead of one WebDriver call per click and keystroke
+PASSENGER_BULK_FILL = os.getenv("PASSENGER_BULK_FILL", "true").lower() in ("1", "true", "yes")
+
+_FILL_PASSENGERS = """
+const [passengers, loc, stepMs, optionalMs, pollMs] = arguments;
+const done = arguments[arguments.length - 1];
+
+const all = xpath => {
+    const snapshot = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const nodes = [];
+    for (let i = 0; i < snapshot.snapshotLength; i++) nodes.push(snapshot.snapshotItem(i));
+    return nodes;
+};
+const first = xpath => all(xpath)[0] || null;
+const clickable = xpath => () => {
+    const el = first(xpath);
+    return el && !el.disabled && el.getClientRects().length ? el : null;
+};
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+async function until(step, condition, ms = stepMs) {
+    const deadline = Date.now() + ms;
+    for (;;) {
+        const value = condition();
+        if (value) return value;
+        if (Date.now() > deadline) {
+            throw new Error(`Timed out after ${ms / 1000}s waiting for ${step.replace(/_/g, ' ')}`);
+        }
+        await sleep(pollMs);
+    }
+}
+
+function setValue(input, value) {
+    const setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+    input.focus();
+    setter.call(input, value);
+    input.dispatchEvent(new Event('input', { bubbles: true }));
+    input.dispatchEvent(new Event('change', { bubbles: true }));
+    input.blur();
+}
+
+(async () => {
+    let removed = 0;
+    let filled = 0;
+    let clearMs = 0;
+    const passengerMs = [];
+    try {
+        let started = performance.now();
+        for (;;) {
+            const rows = all(loc.rows).length;
+            const remove = first(loc.remove);
+            if (!rows || !remove) break;
+            remove.click();
+            await until('passenger_removal', () => all(loc.rows).length < rows);
+            removed++;
+        }
+        clearMs = performance.now() - started;
+
+        for (const [idx, passenger] of passengers.entries()) {
+            started = performance.now();
+            if (idx !== 0) {
+                (await until('add_passenger_button', clickable(loc.add))).click();
+                // The form is ready for the next passenger once the name field is back and empty
+                await until('passenger_form_reset', () => {
+                    const name = first(loc.name);
+                    return name && name.value === '';
+                }, optionalMs).catch(() => null);
+            }
+            const gender = loc.genders[passenger.gender];
+            if (gender) (await until('gender_option', clickable(gender))).click();
+            setValue(await until('name_field', clickable(loc.name)), String(passenger.name || ''));
+            setValue(await until('age_field', clickable(loc.age)), String(passenger.age || ''));
+            (await until('add_passenger_button', clickable(loc.add))).click();
+            passengerMs.push(performance.now() - started);
+            filled++;
+        }
+        done({ removed, filled, clearMs, passengerMs });
+    } catch (e) {
+        done({ removed, filled, clearMs, passengerMs, error: String(e.message || e) });
+    }
+})();
+"""
+
+
+def _xpath(locator):
+    by, value = locator
+    if by == By.XPATH:
+        return value
+    if by == By.ID:
+        return f"//*[@id='{value}']"
+    raise ValueError(f"Unsupported locator for the passenger script: {by}")
+
+
+def fill_passengers(driver, passengers, rows, remove, add, genders, name, age):
+    """
+    Replace the drawer's passenger list with passengers in a single execute_async_script call.
+
+    Args:
+        passengers: [{"name", "age", "gender"}] in booking order
+        rows, remove, add, name, age: Locators for the passenger rows, the first row's delete icon,
+            the Add Passenger button and the name/age inputs
+        genders: {gender: locator of its option}
+
+    Returns:
+        {"removed": saved passengers deleted, "filled": passengers entered, "clearMs": time spent
+        removing them, "passengerMs": [time spent entering each passenger]}
+
+    Raises:
+        WebDriverException: The script failed, returned nothing or a step timed out; the form may be
+            partly filled
+    """
+    locators = {
+        "rows": _xpath(rows),
+        "remove": _xpath(remove),
+        "add": _xpath(add),
+        "name": _xpath(name),
+        "age": _xpath(age),
+        "genders": {gender: _xpath(locator) for gender, locator in genders.items()}
+    }
+    step_ms = browser_waits.step_timeout("passenger_form") * 1000
+    # Removal of up to a full list plus five waits per passenger, each bounded by the step timeout
+    previous_timeout = driver.timeouts.script
+    driver.set_script_timeout(step_ms / 1000 * (6 + 5 * len(passengers)))
+    try:
+        result = driver.execute_async_script(
+            _FILL_PASSENGERS, passengers, locators, step_ms,
+            browser_waits.BROWSER_OPTIONAL_TIMEOUT * 1000, browser_waits.BROWSER_POLL_INTERVAL * 1000
+        )
+    finally:
+        # The driver is pooled, so later scripts must not inherit the long bulk-fill timeout
+        driver.set_script_timeout(previous_timeout)
+    if not isinstance(result, dict):
+        # The page navigated or reloaded before the script called back
+        raise WebDriverException(f"Bulk passenger fill returned no result: {result!r}")
+    if result.get("error"):
+        raise WebDriverException(
+            f"Bulk passenger fill stopped after {result['filled']} of {len(passengers)}: {result['error']}"
+        )
+    return result
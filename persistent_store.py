@@ -0,0 +1,139 @@
+"""
+Optional SQLite store that keeps cached searches and schedules across restarts
+Values are stored as zlib-compressed compact JSON next to their stale/expiry timestamps, and are
+read back lazily when the in-memory caches miss. Enabled by setting PERSISTENT_CACHE_PATH.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+PERSISTENT_CACHE_PATH = os.getenv("PERSISTENT_CACHE_PATH", "")
+# Seconds between sweeps of expired rows
+PERSISTENT_CACHE_PURGE_INTERVAL = float(os.getenv("PERSISTENT_CACHE_PURGE_INTERVAL", "3600"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    stale_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+def encode(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class PersistentStore:
+    """
+    Key/value rows grouped by namespace ("search", "schedule"). Keys are tuples and values any
+    JSON-serializable object. The database is opened on first use, not at import.
+    """
+
+    def __init__(self, path, purge_interval=PERSISTENT_CACHE_PURGE_INTERVAL):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._conn = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def get(self, namespace, key):
+        """(value, stale_at, expires_at) for a live row, None otherwise"""
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value, stale_at, expires_at FROM cache_entries"
+                    " WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (namespace, _key(key), time.time())
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+            return decode(row[0]), row[1], row[2]
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            self.errors += 1
+            print(f"Persistent cache read of {key} failed: {e}")
+            return None
+
+    def put(self, namespace, key, value, stale_at, expires_at):
+        try:
+            blob = encode(value)
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, _key(key), blob, stale_at, expires_at, time.time())
+                )
+                self.writes += 1
+                if time.time() - self._last_purge > self.purge_interval:
+                    self._purge(conn)
+                conn.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.errors += 1
+            print(f"Persistent cache write of {key} failed: {e}")
+
+    def delete(self, namespace, key):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, _key(key)))
+                conn.commit()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Persistent cache delete of {key} failed: {e}")
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._purge(conn)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _purge(self, conn):
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        self._last_purge = time.time()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "errors": self.errors
+            }
+            if self._conn is not None:
+                stats["entries"] = dict(self._conn.execute(
+                    "SELECT namespace, COUNT(*) FROM cache_entries GROUP BY namespace"
+                ).fetchall())
+                stats["bytes"] = self._conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries"
+                ).fetchone()[0]
+            return stats
+
+
+def _key(key):
+    return json.dumps(list(key), separators=(',', ':'))
+
+
+store = PersistentStore(PERSISTENT_CACHE_PATH) if PERSISTENT_CACHE_PATH else None
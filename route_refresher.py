@@ -0,0 +1,130 @@
+"""
+Background refresh of popular searches
+Tracks how often each search key is requested (with exponential decay) and keeps the top-K
+routes fresh in the search cache, so hot searches are answered from memory
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Routes kept refreshed and how often (seconds) the refresh loop runs
+ROUTE_REFRESH_TOP_K = int(os.getenv("ROUTE_REFRESH_TOP_K", "5"))
+ROUTE_REFRESH_INTERVAL = float(os.getenv("ROUTE_REFRESH_INTERVAL", "120"))
+# Popularity halves every this many seconds without new requests
+ROUTE_POPULARITY_HALF_LIFE = float(os.getenv("ROUTE_POPULARITY_HALF_LIFE", "3600"))
+ROUTE_REFRESH_WORKERS = int(os.getenv("ROUTE_REFRESH_WORKERS", "2"))
+# Routes whose score decays below this are forgotten
+_MIN_SCORE = 0.05
+
+
+class RouteRefresher:
+    def __init__(self, refresh, cache, is_live=None, top_k=ROUTE_REFRESH_TOP_K,
+                 half_life=ROUTE_POPULARITY_HALF_LIFE, workers=ROUTE_REFRESH_WORKERS):
+        """
+        Args:
+            refresh: Re-fetches a key and stores it in the cache
+            cache: LRUCache holding the refreshed entries (used to check their freshness)
+            is_live: Optional predicate; keys it rejects (e.g. past dates) are forgotten
+            top_k: Number of most popular keys kept refreshed
+            half_life: Popularity decay half-life in seconds
+            workers: Refreshes run at once
+        """
+        self.refresh = refresh
+        self.cache = cache
+        self.is_live = is_live
+        self.top_k = top_k
+        self.half_life = half_life
+        self._scores = {}  # key -> (score, updated_at)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="route-refresh")
+        self._loop = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def record(self, key):
+        """Count one request for a key"""
+        now = time.time()
+        with self._lock:
+            score, updated_at = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decay(score, now - updated_at) + 1.0, now)
+
+    def top(self, k=None):
+        """Most popular live keys with their current scores, most popular first"""
+        now = time.time()
+        with self._lock:
+            scored = {}
+            for key, (score, updated_at) in list(self._scores.items()):
+                score = self._decay(score, now - updated_at)
+                if score < _MIN_SCORE or (self.is_live and not self.is_live(key)):
+                    del self._scores[key]
+                    continue
+                scored[key] = score
+        ranked = sorted(scored.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k or self.top_k]
+
+    def refresh_async(self, key):
+        """Refresh a key in the background unless a refresh of it is already running"""
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+        self._executor.submit(self._run, key)
+        return True
+
+    def refresh_due(self, horizon):
+        """Refresh top-K keys that are missing from the cache or go stale within horizon seconds"""
+        for key, _ in self.top():
+            freshness = self.cache.freshness(key)
+            if freshness is None or freshness < horizon:
+                self.refresh_async(key)
+
+    def start(self, interval=ROUTE_REFRESH_INTERVAL):
+        """Keep the top-K routes refreshed from a daemon thread"""
+        if self._loop is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    # Refresh what would go stale before the next pass
+                    self.refresh_due(horizon=interval)
+                except Exception as e:
+                    print(f"Route refresh pass failed: {e}")
+
+        self._loop = threading.Thread(target=run, name="route-refresher", daemon=True)
+        self._loop.start()
+
+    def _run(self, key):
+        failed = False
+        try:
+            self.refresh(key)
+        except Exception as e:
+            failed = True
+            print(f"Background refresh of {key} failed: {e}")
+        finally:
+            # Refreshes of different routes finish on several workers at once
+            with self._lock:
+                self._in_flight.discard(key)
+                if failed:
+                    self.failures += 1
+                else:
+                    self.refreshes += 1
+
+    def _decay(self, score, elapsed):
+        return score * 0.5 ** (elapsed / self.half_life)
+
+    def stats(self):
+        with self._lock:
+            in_flight = [list(key) for key in self._in_flight]
+            refreshes, failures = self.refreshes, self.failures
+        return {
+            "tracked": len(self._scores),
+            "topK": self.top_k,
+            "top": [{"key": list(key), "score": round(score, 2)} for key, score in self.top()],
+            "inFlight": in_flight,
+            "refreshes": refreshes,
+            "failures": failures
+        }
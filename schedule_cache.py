@@ -0,0 +1,46 @@
+"""
+In-memory cache for train schedules
+A train's schedule for a date rarely changes, so entries keyed by (train number, journey date,
+starting station) live for hours under an LRU and memory bound
+"""
+import os
+import json
+import time
+import persistent_store
+from search_cache import LRUCache
+
+SCHEDULE_CACHE_TTL = float(os.getenv("SCHEDULE_CACHE_TTL", str(6 * 60 * 60)))
+SCHEDULE_CACHE_MAX_ENTRIES = int(os.getenv("SCHEDULE_CACHE_MAX_ENTRIES", "512"))
+SCHEDULE_CACHE_MAX_BYTES = int(os.getenv("SCHEDULE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def schedule_key(train_number, journey_date, starting_station):
+    """Normalized cache key for a schedule lookup (journey_date as YYYYMMDD)"""
+    return (str(train_number), str(journey_date), starting_station.upper())
+
+
+schedule_cache = LRUCache(SCHEDULE_CACHE_MAX_ENTRIES, SCHEDULE_CACHE_MAX_BYTES, SCHEDULE_CACHE_TTL)
+
+
+def get_schedule(key):
+    """Cached schedule, read through to the persistent store on a memory miss when enabled"""
+    schedule = schedule_cache.get(key)
+    if schedule is not None or persistent_store.store is None:
+        return schedule
+
+    stored = persistent_store.store.get("schedule", key)
+    if stored is None:
+        return None
+    schedule, _, expires_at = stored
+    schedule_cache.put(key, schedule, len(json.dumps(schedule)), ttl=expires_at - time.time())
+    return schedule
+
+
+def put_schedule(key, schedule, size):
+    """Cache a schedule unless upstream answered with an error body"""
+    if isinstance(schedule, dict) and schedule.get('errorMessage'):
+        return
+    schedule_cache.put(key, schedule, size)
+    if persistent_store.store is not None:
+        expires_at = time.time() + SCHEDULE_CACHE_TTL
+        persistent_store.store.put("schedule", key, schedule, expires_at, expires_at)
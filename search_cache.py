@@ -0,0 +1,219 @@
+"""
+In-memory cache for train search results
+Entries are indexed search results keyed by (SRC, DST, JDATE, JQUOTA) with LRU eviction, a memory bound and a per-entry TTL
+Past their TTL entries are served stale for a grace period while they are refreshed in the background
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import persistent_store
+from train_index import build_train_index
+
+# Longest a search result is served from memory (seconds)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+# Shortest TTL, used when upstream availability is already old
+SEARCH_CACHE_MIN_TTL = float(os.getenv("SEARCH_CACHE_MIN_TTL", "60"))
+# How long past its TTL a search is still served (flagged stale) while it is refreshed
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "64"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with per-entry TTL and a bound on the total size of stored values.
+    Sizes are supplied by the caller since only it knows how to measure its values cheaply.
+    An entry may outlive its TTL by stale_ttl seconds, during which lookup() still returns it
+    but flags it as stale so the caller can refresh it.
+    Every entry carries a generation number that is new each time the key is stored, and
+    generation() reports None once the entry is gone (popped, evicted or expired), so callers
+    can tell whether data they derived from an entry is still current.
+    """
+
+    def __init__(self, max_entries, max_bytes, default_ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (value, size, stale_at, expires_at, generation)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._generation = 0  # Last generation handed out
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def get(self, key):
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """(value, stale) for a live entry, (None, False) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            value, size, stale_at, expires_at, _ = entry
+            now = time.time()
+            if expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None, False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            stale = stale_at <= now
+            if stale:
+                self.stale_hits += 1
+            return value, stale
+
+    def freshness(self, key):
+        """Seconds until an entry goes stale (negative once it is), None if absent. Not counted as a hit."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[3] <= time.time():
+                return None
+            return entry[2] - time.time()
+
+    def put(self, key, value, size, ttl=None, stale_ttl=0):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                # Larger than the whole budget, caching it would just flush everything else
+                return
+            stale_at = time.time() + (self.default_ttl if ttl is None else ttl)
+            self._generation += 1
+            self._entries[key] = (value, size, stale_at, stale_at + stale_ttl, self._generation)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def generation(self, key):
+        """Generation of the live entry for key, None if there is none"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            return entry[4]
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._entries:
+                return self._remove(key)
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def keys(self):
+        """Live keys, least recently used first"""
+        now = time.time()
+        with self._lock:
+            return [k for k, (_, _, _, expires_at, _) in self._entries.items() if expires_at > now]
+
+    def _remove(self, key):
+        value, size, _, _, _ = self._entries.pop(key)
+        self._bytes -= size
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "staleHits": self.stale_hits
+            }
+
+
+def search_key(SRC, DST, JDATE, JQUOTA):
+    """Normalized cache key for a search"""
+    return (SRC.upper(), DST.upper(), str(JDATE), JQUOTA.upper())
+
+
+def search_ttl(data):
+    """
+    TTL for a search result derived from the per-class cacheTime upstream reports.
+    The freshest availability entry tells how old upstream's data already was when we
+    received it; that age is taken off SEARCH_CACHE_TTL, floored at SEARCH_CACHE_MIN_TTL.
+    """
+    try:
+        received_at = datetime.fromisoformat(data.get('timeStamp'))
+    except (TypeError, ValueError):
+        return SEARCH_CACHE_TTL
+
+    newest = None
+    for train in data.get('trainBtwnStnsList', []):
+        for avl in train.get('availability', []):
+            if not avl.get('details', {}).get('avlDayList'):
+                continue
+            try:
+                cached_at = datetime.fromisoformat(avl.get('cacheTime'))
+            except (TypeError, ValueError):
+                continue
+            if newest is None or cached_at > newest:
+                newest = cached_at
+
+    if newest is None:
+        return SEARCH_CACHE_TTL
+    age = max(0.0, (received_at - newest).total_seconds())
+    return max(SEARCH_CACHE_MIN_TTL, SEARCH_CACHE_TTL - age)
+
+
+search_cache = LRUCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_TTL)
+
+def get_search(key):
+    return lookup_search(key)[0]
+
+
+def lookup_search(key):
+    """
+    (index, stale) for a cached search, (None, False) on a miss.
+    Memory misses fall through to the persistent store when it is enabled.
+    """
+    index, stale = search_cache.lookup(key)
+    if index is not None or persistent_store.store is None:
+        return index, stale
+
+    stored = persistent_store.store.get("search", key)
+    if stored is None:
+        return None, False
+    data, stale_at, expires_at = stored
+    index = build_train_index(data)
+    now = time.time()
+    search_cache.put(key, index, index.size, ttl=stale_at - now, stale_ttl=expires_at - stale_at)
+    print(f"Loaded {key} from persistent cache")
+    return index, stale_at <= now
+
+
+def put_search(key, index):
+    """Cache an indexed search result (see train_index.TrainIndex), on disk too when enabled"""
+    ttl = search_ttl(index.data)
+    search_cache.put(key, index, index.size, ttl=ttl, stale_ttl=SEARCH_CACHE_STALE_TTL)
+    if persistent_store.store is not None:
+        stale_at = time.time() + ttl
+        persistent_store.store.put("search", key, index.data, stale_at, stale_at + SEARCH_CACHE_STALE_TTL)
+
+
+def drop_search(key):
+    """Remove a search from memory and from the persistent store"""
+    search_cache.pop(key)
+    if persistent_store.store is not None:
+        persistent_store.store.delete("search", key)
@@ -0,0 +1,100 @@
+"""
+Per-session search state
+Each chat session keeps its own recent searches so concurrent users don't overwrite each other's results
+"""
+import os
+import time
+from collections import OrderedDict
+from session_store import SessionStore
+
+# Searches and bytes one session may hold before its oldest searches are dropped
+SESSION_MAX_SEARCHES = int(os.getenv("SESSION_MAX_SEARCHES", "8"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(8 * 1024 * 1024)))
+# Sessions idle for longer than this (seconds) are evicted
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "500"))
+
+DEFAULT_SESSION = "default"
+
+
+class SearchSession:
+    def __init__(self):
+        self.searches = OrderedDict()  # search key -> (data, size)
+        self.latest = None
+        self.bytes = 0
+        self.last_seen = time.time()
+
+
+class SearchSessions(SessionStore):
+    """Search results scoped to chat sessions, with per-session memory limits and idle eviction"""
+
+    def __init__(self, max_searches, max_bytes, idle_ttl, max_sessions):
+        super().__init__(SearchSession, idle_ttl, max_sessions)
+        self.max_searches = max_searches
+        self.max_bytes = max_bytes
+
+    def record(self, session_id, key, data, size):
+        """Store a search result for a session and make it the session's latest search"""
+        with self._lock:
+            session = self._touch(session_id)
+            if key in session.searches:
+                session.bytes -= session.searches.pop(key)[1]
+            session.searches[key] = (data, size)
+            session.bytes += size
+            session.latest = key
+            while len(session.searches) > 1 and (
+                len(session.searches) > self.max_searches or session.bytes > self.max_bytes
+            ):
+                _, (_, dropped_size) = session.searches.popitem(last=False)
+                session.bytes -= dropped_size
+            self._sweep()
+
+    def get(self, session_id, key=None):
+        """A session's search result for key, or its latest search when key is None"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            self._touch(session_id)
+            key = session.latest if key is None else key
+            entry = session.searches.get(key)
+            if entry is None:
+                return None
+            session.searches.move_to_end(key)
+            self._sweep()
+            return entry[0]
+
+    def latest_key(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.latest if session else None
+
+    def holds(self, key):
+        """Whether any session still has a search for key"""
+        with self._lock:
+            return any(key in session.searches for session in self._sessions.values())
+
+    def clear(self, session_id):
+        """Drop a session's searches, returning the keys it held"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            return list(session.searches) if session else []
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(s.bytes for s in self._sessions.values()),
+                "evictedSessions": self.evicted_sessions,
+                "perSession": {
+                    sid: {
+                        "searches": len(s.searches),
+                        "bytes": s.bytes,
+                        "idleSeconds": round(time.time() - s.last_seen)
+                    }
+                    for sid, s in self._sessions.items()
+                }
+            }
+
+
+search_sessions = SearchSessions(SESSION_MAX_SEARCHES, SESSION_MAX_BYTES, SESSION_IDLE_TTL, MAX_SESSIONS)
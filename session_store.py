@@ -0,0 +1,45 @@
+"""
+Session bookkeeping shared by the search and chat stores
+Sessions are ordered by last use. Those idle past idle_ttl are evicted by a periodic sweep, and
+the least recently used go first once there are more than max_sessions.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class SessionStore:
+    """
+    Base for stores keyed by session id. Subclasses hold self._lock around every call to
+    _touch and _sweep.
+    """
+
+    def __init__(self, session_class, idle_ttl, max_sessions):
+        self.session_class = session_class  # Built for a session id seen for the first time
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> session, least recently used first
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.evicted_sessions = 0
+
+    def _touch(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = self.session_class()
+        session.last_seen = time.time()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _sweep(self):
+        """Evict idle sessions (at most once a minute) and enforce the session count limit"""
+        now = time.time()
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            idle = [sid for sid, s in self._sessions.items() if now - s.last_seen > self.idle_ttl]
+            for sid in idle:
+                del self._sessions[sid]
+            self.evicted_sessions += len(idle)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted_sessions += 1
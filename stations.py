@@ -0,0 +1,66 @@
+"""
+City to station lookup backed by indian_railway_stations.json
+The file lists a city's stations in no particular order, so cities with several long-distance
+terminals get a curated order (MAIN_STATIONS) used when only a few stations are searched
+"""
+import os
+import json
+import functools
+
+STATIONS_PATH = os.path.join(os.path.dirname(__file__), 'indian_railway_stations.json')
+
+# Main long-distance terminals per city, busiest first; a city's other stations follow in file order
+MAIN_STATIONS = {
+    "Delhi": ["NDLS", "NZM", "DLI", "ANVT", "DEE", "DSA"],
+    "Mumbai": ["CSTM", "BCT", "LTT", "BDTS", "DR", "TNA", "KYN", "PNVL"],
+    "Kolkata": ["HWH", "SDAH", "KOAA", "SHM"],
+    "Chennai": ["MAS", "MS", "TBM"],
+    "Bangalore": ["SBC", "YPR", "BNC", "YNK"],
+    "Hyderabad": ["SC", "HYB", "KCG"],
+    "Ahmedabad": ["ADI", "SBI", "SBIB"],
+    "Jaipur": ["JP", "GADJ"],
+    "Lucknow": ["LKO", "LC"],
+    "Patna": ["PNBE", "RJPB", "DNR", "PPTA"],
+    "Nagpur": ["NGP", "AJNI"],
+    "Guwahati": ["GHY", "KYQ"],
+    "Kochi": ["ERS", "ERN"],
+    "Siliguri": ["NJP", "SGUJ"],
+    "Allahabad": ["PRYJ", "PRRB"],
+}
+
+
+@functools.lru_cache(maxsize=1)
+def load_stations():
+    """{city: {station code: station name}}, read once per process"""
+    with open(STATIONS_PATH, 'r') as f:
+        return json.load(f)
+
+
+def find_city(city_name):
+    """
+    Resolve a city name (case-insensitive, exact match first, then partial) to (city, stations).
+    Returns (None, {}) when nothing matches.
+    """
+    stations_data = load_stations()
+    for key in stations_data:
+        if key.lower() == city_name.lower():
+            return key, stations_data[key]
+    for key in stations_data:
+        if city_name.lower() in key.lower() or key.lower() in city_name.lower():
+            return key, stations_data[key]
+    return None, {}
+
+
+def station_codes(place, limit=None):
+    """
+    Station codes for a city name, or the code itself when place is already a known station code.
+    A city's main terminals (MAIN_STATIONS) come first, so limit keeps the stations most trains use.
+    """
+    code = place.strip().upper()
+    for stations in load_stations().values():
+        if code in stations:
+            return [code]
+    city, stations = find_city(place.strip())
+    main = [code for code in MAIN_STATIONS.get(city, []) if code in stations]
+    codes = main + [code for code in stations if code not in main]
+    return codes[:limit] if limit else codes
@@ -0,0 +1,71 @@
+"""
+Latency of the named steps in browser flows (booking, sign-in, OTP)
+Each (flow, step) keeps a rolling window of recent durations so percentiles reflect current behaviour
+"""
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+# Most recent samples kept per step
+STEP_TIMING_WINDOW = int(os.getenv("STEP_TIMING_WINDOW", "500"))
+
+
+class StepStats:
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)  # milliseconds
+        self.count = 0
+        self.errors = 0
+
+
+class StepTimings:
+    def __init__(self, window=STEP_TIMING_WINDOW):
+        self.window = window
+        self._steps = {}  # (flow, step) -> StepStats
+        self._lock = threading.Lock()
+
+    def record(self, flow, step, duration_ms, ok=True):
+        with self._lock:
+            stats = self._steps.get((flow, step))
+            if stats is None:
+                stats = self._steps[(flow, step)] = StepStats(self.window)
+            stats.samples.append(duration_ms)
+            stats.count += 1
+            if not ok:
+                stats.errors += 1
+
+    @contextmanager
+    def timed(self, flow, step):
+        """Time the block as one step; a step that raises is recorded as an error"""
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(flow, step, (time.perf_counter() - started) * 1000, ok)
+
+    def summary(self):
+        """{flow: {step: {count, errors, p50, p95, p99, max} in ms}} over each step's window"""
+        with self._lock:
+            snapshot = {key: (list(s.samples), s.count, s.errors) for key, s in self._steps.items()}
+
+        result = {}
+        for (flow, step), (samples, count, errors) in snapshot.items():
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            result.setdefault(flow, {})[step] = {
+                "count": count,
+                "errors": errors,
+                "window": len(samples),
+                "p50": round(float(p50), 1),
+                "p95": round(float(p95), 1),
+                "p99": round(float(p99), 1),
+                "max": round(float(max(samples)), 1)
+            }
+        return result
+
+
+step_timings = StepTimings()
+timed = step_timings.timed
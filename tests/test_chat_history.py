@@ -0,0 +1,43 @@
+from chat_history import AI, HUMAN, ChatSessions
+
+
+def make_sessions(token_budget=60, summary_budget=300):
+    return ChatSessions(token_budget, summary_budget, idle_ttl=3600, max_sessions=10)
+
+
+def test_window_starts_with_a_request():
+    sessions = make_sessions()
+    for i in range(6):
+        sessions.add_user_message("s", f"question {i} " + "x" * 40)
+        sessions.add_ai_message("s", f"answer {i} " + "y" * 40)
+    transcript = sessions.render("s").split("Earlier turns (condensed):")[-1]
+    verbatim = [line for line in transcript.splitlines() if line.startswith((f"{HUMAN}:", f"{AI}:"))]
+    assert verbatim[0].startswith(f"{HUMAN}:")
+    assert verbatim[-1].startswith(f"{AI}: answer 5")
+
+
+def test_latest_exchange_is_kept_over_budget():
+    sessions = make_sessions(token_budget=10)
+    sessions.add_user_message("s", "first " + "x" * 100)
+    sessions.add_ai_message("s", "reply " + "y" * 100)
+    assert "Earlier turns" not in sessions.render("s")
+
+
+def test_condensed_turn_keeps_offered_trains():
+    sessions = make_sessions()
+    sessions.add_user_message("s", "trains from Delhi to Mumbai")
+    sessions.add_ai_message("s", "Found 12951 Rajdhani and 12953 August Kranti, also 12951 again " + "z" * 200)
+    sessions.add_user_message("s", "book the first one")
+    rendered = sessions.render("s")
+    assert "- trains from Delhi to Mumbai -> offered 12951, 12953" in rendered
+    assert f"{HUMAN}: book the first one" in rendered
+
+
+def test_condensed_answer_without_trains_is_shortened():
+    sessions = make_sessions()
+    sessions.add_user_message("s", "hello")
+    sessions.add_ai_message("s", "Where would you like to travel? " + "z" * 300)
+    sessions.add_user_message("s", "Delhi")
+    summary = sessions.render("s").splitlines()[1]
+    assert summary.startswith("- hello -> Where would you like to travel?")
+    assert len(summary) < 100
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stands in for load_dotenv: "loads" a .env file, then reports what the modules read at import
+_PROBE = """
+import json, os, sys, dotenv
+def load_dotenv(*args, **kwargs):
+    os.environ.update({settings!r})
+    return True
+dotenv.load_dotenv = load_dotenv
+import agent
+print(json.dumps({{name: repr(eval(name, dict(sys.modules))) for name in {names!r}}}))
+"""
+
+
+def settings_after_import(settings, names):
+    env = {k: v for k, v in os.environ.items() if k not in settings}
+    env.setdefault("GROQ_API_KEY", "test")
+    probe = _PROBE.format(settings=settings, names=names)
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=REPO, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_router_switch_is_read_from_env_file():
+    found = settings_after_import({"FAST_PATH_ROUTER": "false"}, ["intent_router.FAST_PATH_ROUTER"])
+    assert found["intent_router.FAST_PATH_ROUTER"] == "False"
+
+
+def test_tool_backend_and_memo_size_are_read_from_env_file():
+    found = settings_after_import(
+        {"BACKEND_URL": "http://backend:8000", "TOOL_MEMO_MAX_ENTRIES": "7"},
+        ["tools.BACKEND_URL", "tools.memoized.max_entries"]
+    )
+    assert found["tools.BACKEND_URL"] == "'http://backend:8000'"
+    assert found["tools.memoized.max_entries"] == "7"
+
+
+def test_chat_history_budgets_are_read_from_env_file():
+    found = settings_after_import(
+        {"CHAT_HISTORY_TOKEN_BUDGET": "99", "CHAT_MESSAGE_MAX_CHARS": "50"},
+        ["chat_history.chat_sessions.token_budget", "chat_history.CHAT_MESSAGE_MAX_CHARS"]
+    )
+    assert found["chat_history.chat_sessions.token_budget"] == "99"
+    assert found["chat_history.CHAT_MESSAGE_MAX_CHARS"] == "50"
@@ -0,0 +1,49 @@
+import pytest
+
+from intent_router import match, route
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("show cheapest in 3A", ("cheapest", {"cls": "3A"})),
+    ("Show me the cheapest trains in 3AC class", ("cheapest", {"cls": "3A"})),
+    ("cheapest sleeper trains please", ("cheapest", {"cls": "SL"})),
+    ("cheapest", ("cheapest", {"cls": None})),
+    ("Fastest trains?", ("fastest", {})),
+    ("which trains are available", ("available", {})),
+    ("summary", ("summary", {})),
+    ("details of 12301", ("details", {"number": "12301"})),
+    ("show train 12951", ("details", {"number": "12951"})),
+    ("trains in 2ac", ("by_class", {"cls": "2A"})),
+    ("sleeper trains", ("by_class", {"cls": "SL"})),
+    ("list 3A trains", ("by_class", {"cls": "3A"})),
+    ("show me sl", ("by_class", {"cls": "SL"})),
+    ("rajdhani trains", ("by_type", {"type": "RAJ"})),
+    ("show express", ("by_type", {"type": "EXP"})),
+])
+def test_structured_follow_ups_match(message, expected):
+    assert match(message) == expected
+
+
+@pytest.mark.parametrize("message", [
+    # Short answers to the agent's own questions ("which class?", "which train?")
+    "sl",
+    "SL please",
+    "only 2s",
+    "3A",
+    "in 3A",
+    "express",
+    "mail",
+    "train 12301",
+    "12301",
+    # Open-ended turns
+    "book 12301 in 3A for me",
+    "cheapest trains from delhi to mumbai",
+    "what about tomorrow",
+    "book the second one",
+])
+def test_other_messages_go_to_the_agent(message):
+    assert match(message) is None
+
+
+def test_reply_to_an_agent_question_is_left_to_the_agent():
+    assert route("cheapest in 3A", last_reply="Which class would you like to travel in?") is None
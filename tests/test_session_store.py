@@ -0,0 +1,23 @@
+from session_store import SessionStore
+
+
+class Session:
+    pass
+
+
+def test_least_recently_used_session_is_evicted_over_the_limit():
+    store = SessionStore(Session, idle_ttl=3600, max_sessions=2)
+    for session_id in ("a", "b", "a", "c"):
+        store._touch(session_id)
+        store._sweep()
+    assert list(store._sessions) == ["a", "c"]
+    assert store.evicted_sessions == 1
+
+
+def test_idle_sessions_are_swept():
+    store = SessionStore(Session, idle_ttl=10, max_sessions=5)
+    store._touch("idle").last_seen -= 60
+    store._touch("active")
+    store._last_sweep -= 120
+    store._sweep()
+    assert list(store._sessions) == ["active"]
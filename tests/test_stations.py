@@ -0,0 +1,17 @@
+from stations import station_codes
+
+
+def test_main_terminals_come_first():
+    assert station_codes("Delhi", limit=4) == ["NDLS", "NZM", "DLI", "ANVT"]
+
+
+def test_city_lookup_is_case_insensitive():
+    assert station_codes("mumbai", limit=2) == ["CSTM", "BCT"]
+
+
+def test_known_station_code_is_returned_as_is():
+    assert station_codes("nzm") == ["NZM"]
+
+
+def test_unknown_place_has_no_stations():
+    assert station_codes("Atlantis") == []
@@ -0,0 +1,56 @@
+"""
+Memoized agent tool results
+Read-only tools format the same cached search again each time the agent calls them. Results are
+kept per (tool, arguments, session, search version); the version names the session's latest
+search and its cache generation, so a memoized answer is reused only while that data stands.
+"""
+import os
+import functools
+import threading
+from collections import OrderedDict
+
+TOOL_MEMO_MAX_ENTRIES = int(os.getenv("TOOL_MEMO_MAX_ENTRIES", "256"))
+
+
+class ToolMemo:
+    def __init__(self, version, session, max_entries=TOOL_MEMO_MAX_ENTRIES):
+        """
+        Args:
+            version: Returns the session's search version, or None (no search, or unreadable)
+            session: Returns the chat session the tool is being called for
+            max_entries: Results kept, least recently used dropped first
+        """
+        self.version = version
+        self.session = session
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            version = self.version()
+            if version is None:
+                return fn(*args, **kwargs)
+            key = (fn.__name__, args, tuple(sorted(kwargs.items())), self.session(), version)
+            with self._lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return self._results[key]
+                self.misses += 1
+            result = fn(*args, **kwargs)
+            # Failures may be transient, so only real answers are kept
+            if not result.startswith("Error"):
+                with self._lock:
+                    self._results[key] = result
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            return result
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._results), "hits": self.hits, "misses": self.misses}
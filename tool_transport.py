@@ -0,0 +1,67 @@
+"""
+How agent tools reach the backend API
+HttpTransport sends requests to a separately deployed backend over a keep-alive session.
+InProcessTransport is used when the agent runs inside the backend process: requests are
+dispatched straight into the Flask app through WSGI, with no socket, loopback connection or
+HTTP parsing in between. Both take the same URLs and keyword arguments as requests.
+"""
+import json
+from urllib.parse import urlsplit
+import requests
+
+
+class HttpTransport:
+    def __init__(self):
+        self.session = requests.Session()
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+class InProcessResponse:
+    """The parts of requests.Response the tools read, over a Flask test response"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.get_data()
+        self._json = response.get_json(silent=True)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        if self._json is None:
+            # Same failure requests raises for a body that isn't JSON
+            return json.loads(self.text)
+        return self._json
+
+
+class InProcessTransport:
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, url, params=None, json=None, headers=None, timeout=None, **kwargs):
+        # timeout has no meaning in-process; the handler runs on the calling thread
+        parts = urlsplit(url)
+        client = self.app.test_client()
+        # A fresh app context keeps the handler's flask.g separate from the request calling the tool
+        with self.app.app_context():
+            response = client.open(
+                parts.path, method=method, query_string=params or parts.query or None,
+                json=json, headers=headers, **kwargs
+            )
+        return InProcessResponse(response)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
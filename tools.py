@@ -2,13 +2,91 @@
 LangChain Tools for Train Booking Agent
 Defines all API tools that the agent can use
 """
+import os
 import requests
 from langchain.tools import tool
 from typing import Optional
+from contextvars import ContextVar
 import json
+import time
 from datetime import datetime
+from stations import load_stations, find_city
+from tool_transport import HttpTransport
+from tool_memo import ToolMemo
 
-BACKEND_URL = "http://localhost:5000"
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:5000")
+# Seconds each job result poll may block on the backend, and the most a job is waited for
+JOB_POLL_WAIT = 20
+JOB_DEADLINE = 600
+
+# How tool calls reach the backend; the backend swaps in an in-process transport when it hosts the agent
+backend = HttpTransport()
+
+def use_transport(transport):
+    global backend
+    backend = transport
+
+# Chat session the agent is currently serving, forwarded to the backend so searches stay per-session
+current_session_id: ContextVar[str] = ContextVar("current_session_id", default="default")
+
+def set_session_id(session_id: str):
+    """Scope subsequent tool calls in this context to a chat session"""
+    return current_session_id.set(session_id)
+
+def session_headers() -> dict:
+    """Headers identifying the current chat session to the backend"""
+    return {"X-Session-Id": current_session_id.get()}
+
+def run_backend_job(method: str, path: str, **kwargs) -> requests.Response:
+    """
+    Run a slow backend operation (search, booking, sign-in, reset) as a job: submit it with
+    ?async=1, then long-poll /jobs/<id>/result until it finishes. Returns the final response,
+    which carries the operation's own status code, or the last 202 if JOB_DEADLINE passes.
+    """
+    params = {**kwargs.pop("params", {}), "async": "1"}
+    headers = {**kwargs.pop("headers", {}), **session_headers()}
+    response = backend.request(method, f"{BACKEND_URL}{path}", params=params, headers=headers, timeout=30, **kwargs)
+    if response.status_code != 202:
+        return response
+    
+    result_url = f"{BACKEND_URL}{response.json()['resultUrl']}"
+    deadline = time.monotonic() + JOB_DEADLINE
+    while True:
+        response = backend.get(result_url, params={"wait": JOB_POLL_WAIT}, timeout=JOB_POLL_WAIT + 10, headers=session_headers())
+        if response.status_code != 202 or time.monotonic() > deadline:
+            return response
+
+def has_cached_search() -> bool:
+    """Whether the backend holds a search for the current session that /trains/* can read"""
+    try:
+        response = backend.get(f"{BACKEND_URL}/trains/summary", timeout=5, headers=session_headers())
+        return response.status_code == 200
+    except requests.RequestException:
+        return False
+
+def search_version() -> Optional[str]:
+    """Version of the current session's search (see /search/version), None if there is none"""
+    try:
+        response = backend.get(f"{BACKEND_URL}/search/version", timeout=5, headers=session_headers())
+        return response.json()["version"] if response.status_code == 200 else None
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+# Read-only tools over the cached search reuse their answer until the search changes
+memoized = ToolMemo(search_version, current_session_id.get)
+
+def search_context_lines(train: dict) -> str:
+    """
+    Date and station lines for trains from flexible-date or city searches (the backend sends
+    journeyDate as YYYYMMDD and fromStation/toStation), empty for plain searches
+    """
+    lines = ""
+    jdate = train.get('journeyDate')
+    if jdate:
+        lines += f"   Date: {datetime.strptime(jdate, '%Y%m%d').strftime('%d-%m-%Y')}\n"
+    if train.get('fromStation') and train.get('toStation'):
+        lines += f"   From: {train['fromStation']}, To: {train['toStation']}\n"
+    return lines
 
 @tool
 def search_trains(query: str) -> str:
@@ -56,15 +134,14 @@ def search_trains(query: str) -> str:
         except ValueError:
             return json.dumps({"error": "Invalid date format. Use DD-MM-YYYY"})
 
-        response = requests.post(
-            f"{BACKEND_URL}/getTrainDetailsWithRefresh",
+        response = run_backend_job(
+            "POST", "/getTrainDetailsWithRefresh",
             json={
                 "SRC": source,
                 "DST": destination,
                 "JDATE": formatted_date,
                 "JQUOTA": quota
-            },
-            timeout=360
+            }
         )
         
         if response.status_code == 200:
@@ -83,6 +160,135 @@ def search_trains(query: str) -> str:
 
 
 @tool
+def search_trains_flexible(query: str) -> str:
+    """
+    Search trains between two stations on every date around a given date at once.
+    Use this tool when the user's date is approximate (e.g. "around the 25th", "that weekend",
+    "a day or two either way") instead of calling search_trains once per date.
+    
+    IMPORTANT: Always ask the user for the quota before searching (GN, TQ, LD, PT).
+    
+    Input should be a JSON string with format:
+    {"source": "NDLS", "destination": "BCT", "date": "25-11-2025", "quota": "GN", "days": 2}
+    "days" is how many days before and after the date to include (default 2, max 3).
+    
+    Args:
+        query: JSON string containing source, destination, date, quota and optional days
+    
+    Returns:
+        Summary of trains found per date. The results are cached, so get_available_trains,
+        get_cheapest_trains, filter_trains etc. then cover all dates and show each train's date.
+    """
+    try:
+        params = json.loads(query)
+        source = params.get("source", "").upper()
+        destination = params.get("destination", "").upper()
+        date = params.get("date", "")
+        quota = params.get("quota", "").upper()
+        
+        if not all([source, destination, date, quota]):
+            return json.dumps({"error": "Missing required fields: source, destination, date, or quota. Please ask user for quota if not provided."})
+        
+        try:
+            formatted_date = datetime.strptime(date, "%d-%m-%Y").strftime("%Y%m%d")
+        except ValueError:
+            return json.dumps({"error": "Invalid date format. Use DD-MM-YYYY"})
+        
+        payload = {
+            "SRC": source,
+            "DST": destination,
+            "JDATE": formatted_date,
+            "JQUOTA": quota
+        }
+        if params.get("days") is not None:
+            payload["days"] = int(params["days"])
+        
+        response = run_backend_job("POST", "/getTrainDetailsFlexible", json=payload)
+        
+        if response.status_code == 200:
+            meta = response.json().get('searchMeta', {})
+            summary = f"Searched {source} to {destination} around {date}:\n"
+            for day in meta.get('dates', []):
+                day_str = datetime.strptime(day['date'], '%Y%m%d').strftime('%d-%m-%Y')
+                summary += f"- {day_str}: {day['trains']} trains\n"
+            for error in meta.get('errors', []):
+                day_str = datetime.strptime(error['date'], '%Y%m%d').strftime('%d-%m-%Y')
+                summary += f"- {day_str}: search failed ({error.get('message')})\n"
+            summary += "Data cached for all dates. Use get_available_trains, get_cheapest_trains or filter_trains to compare them."
+            return summary
+        else:
+            return f"Error searching trains: {response.status_code}"
+    except json.JSONDecodeError as e:
+        return f"Error parsing input JSON: {str(e)}. Expected format: {{'source': 'NDLS', 'destination': 'BCT', 'date': '25-11-2025', 'quota': 'GN', 'days': 2}}"
+    except Exception as e:
+        return f"Error calling flexible search API: {str(e)}"
+
+
+@tool
+def search_trains_by_city(query: str) -> str:
+    """
+    Search trains between two cities across all their main stations at once.
+    Use this tool when the user gives city names (e.g. "Delhi to Mumbai") and has not picked
+    specific stations, instead of searching one station pair at a time.
+    
+    IMPORTANT: Always ask the user for the quota before searching (GN, TQ, LD, PT).
+    
+    Input should be a JSON string with format:
+    {"from_city": "Delhi", "to_city": "Mumbai", "date": "25-11-2025", "quota": "GN"}
+    Station codes (e.g. "NDLS") also work in place of a city name.
+    
+    Args:
+        query: JSON string containing from_city, to_city, date and quota (all required)
+    
+    Returns:
+        Summary of trains found per station pair. The merged results are cached, so
+        get_available_trains, get_cheapest_trains, filter_trains etc. then cover every station.
+    """
+    try:
+        params = json.loads(query)
+        from_city = params.get("from_city", "")
+        to_city = params.get("to_city", "")
+        date = params.get("date", "")
+        quota = params.get("quota", "").upper()
+        
+        if not all([from_city, to_city, date, quota]):
+            return json.dumps({"error": "Missing required fields: from_city, to_city, date, or quota. Please ask user for quota if not provided."})
+        
+        try:
+            formatted_date = datetime.strptime(date, "%d-%m-%Y").strftime("%Y%m%d")
+        except ValueError:
+            return json.dumps({"error": "Invalid date format. Use DD-MM-YYYY"})
+        
+        response = run_backend_job(
+            "POST", "/getTrainDetailsByCity",
+            json={
+                "fromCity": from_city,
+                "toCity": to_city,
+                "JDATE": formatted_date,
+                "JQUOTA": quota
+            }
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            meta = data.get('searchMeta', {})
+            summary = f"Found {len(data.get('trainBtwnStnsList', []))} trains from {from_city} to {to_city} on {date}:\n"
+            for pair in meta.get('pairs', []):
+                summary += f"- {pair['source']} -> {pair['destination']}: {pair['trains']} trains\n"
+            summary += "Data cached successfully. Use get_available_trains to see trains with available seats."
+            return summary
+        elif response.status_code == 400:
+            return response.json().get('message', 'No stations found for the given cities')
+        else:
+            return f"Error searching trains: {response.status_code}"
+    except json.JSONDecodeError as e:
+        return f"Error parsing input JSON: {str(e)}. Expected format: {{'from_city': 'Delhi', 'to_city': 'Mumbai', 'date': '25-11-2025', 'quota': 'GN'}}"
+    except Exception as e:
+        return f"Error calling city search API: {str(e)}"
+
+
+@tool
+@memoized
 def get_available_trains(dummy: str = "") -> str:
     """
     Get all trains that have available seats from the cached search results.
@@ -95,7 +301,7 @@ def get_available_trains(dummy: str = "") -> str:
         JSON string with available trains, their classes, fares, and timings
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/trains/available", timeout=360)
+        response = backend.get(f"{BACKEND_URL}/trains/available", timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             data = response.json()
@@ -108,6 +314,7 @@ def get_available_trains(dummy: str = "") -> str:
             result = f"Found {data['count']} trains with available seats:\n\n"
             for i, train in enumerate(trains[:10], 1):  # Limit to top 10
                 result += f"{i}. Train {train['trainNumber']} - {train['trainName']}\n"
+                result += search_context_lines(train)
                 result += f"   Departure: {train['departureTime']}, Arrival: {train['arrivalTime']}\n"
                 result += f"   Duration: {train['duration']}\n"
                 result += f"   Available classes: "
@@ -122,6 +329,7 @@ def get_available_trains(dummy: str = "") -> str:
 
 
 @tool
+@memoized
 def get_cheapest_trains(train_class: Optional[str] = None) -> str:
     """
     Get the cheapest available trains sorted by fare.
@@ -137,7 +345,7 @@ def get_cheapest_trains(train_class: Optional[str] = None) -> str:
         if train_class:
             params['class'] = train_class.upper()
         
-        response = requests.get(f"{BACKEND_URL}/trains/cheapest", params=params, timeout=360)
+        response = backend.get(f"{BACKEND_URL}/trains/cheapest", params=params, timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             data = response.json()
@@ -149,6 +357,7 @@ def get_cheapest_trains(train_class: Optional[str] = None) -> str:
             result = f"Top {len(trains)} cheapest trains{' in ' + train_class if train_class else ''}:\n\n"
             for i, train in enumerate(trains[:5], 1):
                 result += f"{i}. Train {train['trainNumber']} - {train['trainName']}\n"
+                result += search_context_lines(train)
                 result += f"   Class: {train['class']}, Fare: ₹{train['fare']}\n"
                 result += f"   Departure: {train['departureTime']}, Arrival: {train['arrivalTime']}\n"
                 result += f"   Duration: {train['duration']}\n\n"
@@ -161,6 +370,7 @@ def get_cheapest_trains(train_class: Optional[str] = None) -> str:
 
 
 @tool
+@memoized
 def get_fastest_trains(dummy: str = "") -> str:
     """
     Get the fastest trains sorted by journey duration.
@@ -173,7 +383,7 @@ def get_fastest_trains(dummy: str = "") -> str:
         JSON string with fastest trains
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/trains/fastest", timeout=360)
+        response = backend.get(f"{BACKEND_URL}/trains/fastest", timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             data = response.json()
@@ -185,6 +395,7 @@ def get_fastest_trains(dummy: str = "") -> str:
             result = f"Top {len(trains)} fastest trains:\n\n"
             for i, train in enumerate(trains[:5], 1):
                 result += f"{i}. Train {train['trainNumber']} - {train['trainName']}\n"
+                result += search_context_lines(train)
                 result += f"   Duration: {train['duration']}\n"
                 result += f"   Departure: {train['departureTime']}, Arrival: {train['arrivalTime']}\n"
                 result += f"   Type: {', '.join(train['trainType'])}\n\n"
@@ -197,6 +408,7 @@ def get_fastest_trains(dummy: str = "") -> str:
 
 
 @tool
+@memoized
 def get_train_details(train_number: str) -> str:
     """
     Get detailed information about a specific train.
@@ -208,7 +420,7 @@ def get_train_details(train_number: str) -> str:
         JSON string with complete train details including all classes and availability
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/trains/{train_number}", timeout=360)
+        response = backend.get(f"{BACKEND_URL}/trains/{train_number}", timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             train = response.json()
@@ -239,6 +451,7 @@ def get_train_details(train_number: str) -> str:
 
 
 @tool
+@memoized
 def filter_trains(
     train_type: Optional[str] = None,
     departure_after: Optional[str] = None,
@@ -271,7 +484,7 @@ def filter_trains(
         if classes:
             filters["classes"] = [c.strip().upper() for c in classes.split(',')]
         
-        response = requests.post(f"{BACKEND_URL}/trains/filter", json=filters, timeout=360)
+        response = backend.post(f"{BACKEND_URL}/trains/filter", json=filters, timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             data = response.json()
@@ -283,6 +496,7 @@ def filter_trains(
             result = f"Found {data['count']} trains matching filters:\n\n"
             for i, train in enumerate(trains[:10], 1):
                 result += f"{i}. Train {train['trainNumber']} - {train['trainName']}\n"
+                result += search_context_lines(train)
                 result += f"   Departure: {train['departureTime']}, Arrival: {train['arrivalTime']}\n"
                 result += f"   Duration: {train['duration']}, Distance: {train['distance']} km\n"
                 if train.get('availableClasses'):
@@ -332,10 +546,11 @@ def get_train_route(query: str) -> str:
             "startingStationCode": starting_station
         }
         
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/trains/{train_number}/route",
             params=api_params,
-            timeout=360
+            timeout=360,
+            headers=session_headers()
         )
         
         if response.status_code == 200:
@@ -365,6 +580,7 @@ def get_train_route(query: str) -> str:
 
 
 @tool
+@memoized
 def get_trains_summary(dummy: str = "") -> str:
     """
     Get a summary of all searched trains including statistics.
@@ -377,7 +593,7 @@ def get_trains_summary(dummy: str = "") -> str:
         Summary statistics of the cached train data
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/trains/summary", timeout=360)
+        response = backend.get(f"{BACKEND_URL}/trains/summary", timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             data = response.json()
@@ -416,9 +632,10 @@ def get_train_booking_options(train_number: str) -> str:
         JSON string with availability across multiple days for all quota/class combinations
     """
     try:
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/booktrain/{train_number}",
-            timeout=360  # This scrapes live data, may take time
+            timeout=360,  # This scrapes live data, may take time
+            headers=session_headers()
         )
         
         if response.status_code == 200:
@@ -516,12 +733,8 @@ def book_train(booking_data: str) -> str:
             except (ValueError, TypeError):
                 return f"❌ Invalid age format for passenger {i}. Must be a number"
         
-        # Make the booking request
-        response = requests.post(
-            f"{BACKEND_URL}/booktrain/",
-            json=params,
-            timeout=360  # Booking may take time
-        )
+        # Make the booking request (runs as a backend job that is polled)
+        response = run_backend_job("POST", "/booktrain/", json=params)
         
         if response.status_code == 200:
             result = "✅ Booking process initiated successfully!\n\n"
@@ -551,6 +764,7 @@ def book_train(booking_data: str) -> str:
 
 
 @tool
+@memoized
 def get_trains_by_class(class_code: str) -> str:
     """
     Get all trains that have available seats in a specific class.
@@ -564,9 +778,10 @@ def get_trains_by_class(class_code: str) -> str:
         JSON string with trains having the specified class available
     """
     try:
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/trains/by-class/{class_code.upper()}",
-            timeout=360
+            timeout=360,
+            headers=session_headers()
         )
         
         if response.status_code == 200:
@@ -591,6 +806,7 @@ def get_trains_by_class(class_code: str) -> str:
 
 
 @tool
+@memoized
 def get_trains_by_type(train_type: str) -> str:
     """
     Get trains filtered by train type.
@@ -604,9 +820,10 @@ def get_trains_by_type(train_type: str) -> str:
         JSON string with trains of the specified type
     """
     try:
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/trains/by-type/{train_type.upper()}",
-            timeout=360
+            timeout=360,
+            headers=session_headers()
         )
         
         if response.status_code == 200:
@@ -645,9 +862,10 @@ def get_train_booking_options(train_number: str) -> str:
         JSON string with availability across multiple days for all quota/class combinations
     """
     try:
-        response = requests.get(
+        response = backend.get(
             f"{BACKEND_URL}/booktrain/{train_number}",
-            timeout=360  # This scrapes live data, may take time
+            timeout=360,  # This scrapes live data, may take time
+            headers=session_headers()
         )
         
         if response.status_code == 200:
@@ -695,11 +913,8 @@ def book_train_submit(booking_data: str) -> str:
     try:
         params = json.loads(booking_data)
         
-        response = requests.post(
-            f"{BACKEND_URL}/booktrain/",
-            json=params,
-            timeout=360  # Booking may take time
-        )
+        # Booking takes a while, so it runs as a backend job that is polled
+        response = run_backend_job("POST", "/booktrain/", json=params)
         
         if response.status_code == 200:
             return "✅ Booking initiated successfully! An OTP has been sent to the registered mobile number. Please ask the user to provide the OTP to complete the booking."
@@ -724,10 +939,11 @@ def submit_booking_otp(otp: str) -> str:
         Status message about OTP submission
     """
     try:
-        response = requests.post(
+        response = backend.post(
             f"{BACKEND_URL}/otp-booking",
             json={"otp": otp},
-            timeout=360
+            timeout=360,
+            headers=session_headers()
         )
         
         if response.status_code == 200:
@@ -749,26 +965,8 @@ def get_city_stations(city_name: str) -> str:
         Formatted string with list of stations in the city
     """
     try:
-        # Load the JSON file
-        import os
-        json_path = os.path.join(os.path.dirname(__file__), 'indian_railway_stations.json')
-        
-        with open(json_path, 'r') as f:
-            stations_data = json.load(f)
-        
-        # Search for city (case-insensitive)
-        city_key = None
-        for key in stations_data.keys():
-            if key.lower() == city_name.lower():
-                city_key = key
-                break
-        
-        if not city_key:
-            # Try partial match
-            for key in stations_data.keys():
-                if city_name.lower() in key.lower() or key.lower() in city_name.lower():
-                    city_key = key
-                    break
+        stations_data = load_stations()
+        city_key, _ = find_city(city_name)
         
         if not city_key:
             return f"❌ No stations found for city: {city_name}\n\nAvailable cities: {', '.join(list(stations_data.keys())[:20])}..."
@@ -804,7 +1002,7 @@ def show_payment_page(dummy: str = "") -> str:
         Status message about browser visibility
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/show-payment-page", timeout=360)
+        response = backend.get(f"{BACKEND_URL}/show-payment-page", timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             data = response.json()
@@ -828,7 +1026,7 @@ def hide_browser(dummy: str = "") -> str:
         Status message
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/hide-browser", timeout=360)
+        response = backend.get(f"{BACKEND_URL}/hide-browser", timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             return "✅ Browser hidden successfully."
@@ -849,7 +1047,7 @@ def signin_user(phone_number: str) -> str:
     
     # First, ensure browser is initialized
     try:
-        init_response = requests.get(f"{BACKEND_URL}/init-browser")
+        init_response = backend.get(f"{BACKEND_URL}/init-browser", headers=session_headers())
         if init_response.status_code != 200:
             init_data = init_response.json()
             if init_data.get("status") != "already_initialized":
@@ -859,11 +1057,7 @@ def signin_user(phone_number: str) -> str:
     
     # Now attempt sign-in
     try:
-        response = requests.post(
-            f"{BACKEND_URL}/signin",
-            json={"phone_number": phone_number},
-            headers={"Content-Type": "application/json"}
-        )
+        response = run_backend_job("POST", "/signin", json={"phone_number": phone_number})
         
         if response.status_code == 200:
             data = response.json()
@@ -888,10 +1082,11 @@ def submit_signin_otp(otp: str) -> str:
         Status message about sign-in completion
     """
     try:
-        response = requests.post(
+        response = backend.post(
             f"{BACKEND_URL}/ask-otp-signin",
             json={"otp": otp},
-            timeout=360
+            timeout=360,
+            headers=session_headers()
         )
         
         if response.status_code == 200:
@@ -924,7 +1119,7 @@ def reset_browser(dummy: str = "") -> str:
         Status message
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/tryagain", timeout=60)
+        response = run_backend_job("GET", "/tryagain")
         
         if response.status_code == 200:
             return "Browser reset successfully. Cache cleared. Ready for new search."
@@ -947,7 +1142,7 @@ def close_browser(dummy: str = "") -> str:
         Status message
     """
     try:
-        response = requests.get(f"{BACKEND_URL}/closeBrowser", timeout=360)
+        response = backend.get(f"{BACKEND_URL}/closeBrowser", timeout=360, headers=session_headers())
         
         if response.status_code == 200:
             return "Browser closed successfully."
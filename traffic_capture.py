@@ -0,0 +1,90 @@
+"""
+Indexed capture of upstream traffic seen by a selenium-wire driver
+Responses whose URL matches a watched pattern are parsed once, as they arrive, and indexed by
+pattern so callers get the request payload, headers and response in a single lookup
+"""
+import json
+import threading
+from seleniumwire.utils import decode
+from selenium.common.exceptions import TimeoutException
+from disha_client import HOP_HEADERS
+
+
+class CapturedCall:
+    def __init__(self, request, response):
+        self.url = request.url
+        self.payload = _parse_json(request.body)
+        self.headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+        self.status_code = response.status_code
+        body = decode(response.body, response.headers.get('Content-Encoding', 'identity'))
+        # Decoded, like the bodies of replayed calls, so both are measured the same way
+        self.response_size = len(body or b"")
+        self.response_json = _parse_json(body)
+        # Time between the page sending the request and upstream answering it
+        self.latency_ms = round((response.date - request.date).total_seconds() * 1000)
+
+
+class TrafficCapture:
+    """
+    Indexes a driver's intercepted responses by watched URL pattern (plain substrings).
+    Only the latest call per pattern is kept.
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = list(patterns)
+        self._calls = {}
+        self._cond = threading.Condition()
+
+    def watch(self, pattern):
+        with self._cond:
+            if pattern not in self.patterns:
+                self.patterns.append(pattern)
+
+    def install(self, driver):
+        """Hook into the driver's responses and limit selenium-wire's own storage to the API host"""
+        driver.response_interceptor = self._on_response
+        driver.scopes = [r'.*api\.disha\.corover\.ai.*']
+        driver.traffic_capture = self
+        return self
+
+    def _on_response(self, request, response):
+        # Runs on selenium-wire's proxy thread for every in-scope response, so keep the miss path cheap.
+        # The API calls are POSTs; CORS preflights (OPTIONS) to the same URL have no body to index.
+        if request.method != "POST":
+            return
+        for pattern in self.patterns:
+            if pattern in request.url:
+                try:
+                    call = CapturedCall(request, response)
+                except Exception as e:
+                    print(f"Failed to parse captured {pattern} call: {e}")
+                    return
+                with self._cond:
+                    self._calls[pattern] = call
+                    self._cond.notify_all()
+                return
+
+    def reset(self, pattern):
+        """Forget the last call for a pattern, e.g. before triggering a new one"""
+        with self._cond:
+            self._calls.pop(pattern, None)
+
+    def latest(self, pattern):
+        with self._cond:
+            return self._calls.get(pattern)
+
+    def wait_for(self, pattern, timeout):
+        """Block until a call matching pattern has a response. Raises TimeoutException."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: pattern in self._calls, timeout=timeout):
+                raise TimeoutException(f"Timed out after {timeout}s waiting for a response from {pattern}")
+            return self._calls[pattern]
+
+
+def _parse_json(body):
+    if not body:
+        return None
+    try:
+        return json.loads(body.decode('utf-8') if isinstance(body, bytes) else body)
+    except (ValueError, UnicodeDecodeError):
+        return None
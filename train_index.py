@@ -0,0 +1,287 @@
+"""
+Normalized index over a train search result
+Built once when a search is ingested so the /trains/* endpoints answer from precomputed
+fields instead of re-walking and re-parsing trainBtwnStnsList on every request
+The (train x class) rows are also laid out as NumPy columns so filter and sort run vectorized
+"""
+import json
+import numpy as np
+
+# Availability status codes, in the precedence the endpoints have always used
+STATUS_AVAILABLE = "AVAILABLE"
+STATUS_WAITLIST = "WL"
+STATUS_RAC = "RAC"
+STATUS_OTHER = "OTHER"
+# Column position of each status in AvailabilityTable.status
+STATUS_CODES = [STATUS_AVAILABLE, STATUS_WAITLIST, STATUS_RAC, STATUS_OTHER]
+
+RUNNING_DAYS = [
+    ('monday', 'runningMon'),
+    ('tuesday', 'runningTue'),
+    ('wednesday', 'runningWed'),
+    ('thursday', 'runningThu'),
+    ('friday', 'runningFri'),
+    ('saturday', 'runningSat'),
+    ('sunday', 'runningSun')
+]
+
+
+def status_code(status):
+    """Classify a raw availablityStatus string"""
+    if not status:
+        return STATUS_OTHER
+    if status.startswith('AVAILABLE'):
+        return STATUS_AVAILABLE
+    if 'WL' in status:
+        return STATUS_WAITLIST
+    if 'RAC' in status:
+        return STATUS_RAC
+    return STATUS_OTHER
+
+
+def to_minutes(hhmm):
+    """'HH:MM' -> minutes, None if missing or malformed"""
+    try:
+        hours, minutes = hhmm.split(':')
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return None
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ClassAvailability:
+    """One (train, class) availability entry"""
+
+    def __init__(self, train, avl):
+        details = avl.get('details', {}).get('avlDayList', {})
+        self.train = train
+        self.class_name = avl.get('className')
+        self.status = details.get('availablityStatus')  # raw, None when upstream sent none
+        self.status_code = status_code(self.status)
+        self.fare = details.get('totalFare')  # raw string as upstream sent it
+        self.fare_value = to_int(self.fare)
+        self.available = self.status_code == STATUS_AVAILABLE
+
+    def to_dict(self):
+        return {'class': self.class_name, 'status': self.status, 'fare': self.fare}
+
+
+class IndexedTrain:
+    def __init__(self, raw):
+        self.raw = raw
+        self.number = raw.get('trainNumber')
+        self.name = raw.get('trainName')
+        self.departure = raw.get('departureTime')
+        self.arrival = raw.get('arrivalTime')
+        self.duration = raw.get('duration')
+        self.journey_date = raw.get('journeyDate')  # only set on merged multi-date searches
+        self.search_pair = raw.get('searchPair')  # only set on merged city searches
+        self.departure_minutes = to_minutes(self.departure)
+        self.arrival_minutes = to_minutes(self.arrival)
+        self.duration_minutes = to_minutes(self.duration)
+        self.types = raw.get('trainType', [])
+        self.classes = [ClassAvailability(self, avl) for avl in raw.get('availability', [])]
+        self.available_classes = [c for c in self.classes if c.available]
+        self.has_available = bool(self.available_classes)
+
+    def basic(self):
+        """Fields every train listing shares"""
+        fields = {
+            'trainNumber': self.number,
+            'trainName': self.name,
+            'departureTime': self.departure,
+            'arrivalTime': self.arrival,
+            'duration': self.duration
+        }
+        if self.journey_date:
+            fields['journeyDate'] = self.journey_date
+        if self.search_pair:
+            fields['fromStation'] = self.raw.get('fromStnCode')
+            fields['toStation'] = self.raw.get('toStnCode')
+        return fields
+
+    def running_days(self):
+        return {day: self.raw.get(field) == 'Y' for day, field in RUNNING_DAYS}
+
+
+class TrainIndex:
+    """Normalized view of one search result (the raw payload stays available as .data)"""
+
+    def __init__(self, data):
+        self.data = data
+        # Approximate memory footprint, measured as the compact JSON size of the payload
+        self.size = len(json.dumps(data, separators=(',', ':')))
+        self.trains = [IndexedTrain(t) for t in data.get('trainBtwnStnsList', [])]
+        self.rows = [row for train in self.trains for row in train.classes]
+
+        self.by_number = {}
+        for train in self.trains:
+            self.by_number.setdefault(train.number, train)
+
+        self.by_class = {}
+        for row in self.rows:
+            self.by_class.setdefault(row.class_name, []).append(row)
+
+        self.by_type = {}
+        for train in self.trains:
+            for t_type in train.types:
+                self.by_type.setdefault(t_type, []).append(train)
+
+        self.status_counts = {STATUS_AVAILABLE: 0, STATUS_WAITLIST: 0, STATUS_RAC: 0, STATUS_OTHER: 0}
+        for row in self.rows:
+            self.status_counts[row.status_code] += 1
+
+        self.type_counts = {t_type: len(trains) for t_type, trains in self.by_type.items()}
+        self.class_counts = {class_name: len(rows) for class_name, rows in self.by_class.items()}
+
+        self.table = AvailabilityTable(self.trains, self.rows)
+
+    def available_trains(self):
+        return [t for t in self.trains if t.has_available]
+
+
+def _minutes_column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+class AvailabilityTable:
+    """
+    Columnar layout of a search: one array entry per (train, class) row, plus per-train columns.
+    Missing fares and times are NaN. Train types are a bitmask over type_names.
+    """
+
+    def __init__(self, trains, rows):
+        self.trains = trains
+        self.rows = rows
+        self.type_names = sorted({t for train in trains for t in train.types})
+        type_bits = {t: 1 << i for i, t in enumerate(self.type_names)}
+        self.class_names = sorted({row.class_name for row in rows if row.class_name is not None})
+        class_ids = {c: i for i, c in enumerate(self.class_names)}
+        train_ids = {id(train): i for i, train in enumerate(trains)}
+
+        # Per-train columns
+        self.train_departure = _minutes_column([t.departure_minutes for t in trains])
+        self.train_duration = _minutes_column([t.duration_minutes for t in trains])
+        self.train_available = np.array([t.has_available for t in trains], dtype=bool)
+        self.train_types = np.array(
+            [sum(type_bits[t] for t in set(train.types)) for train in trains], dtype=np.int64
+        )
+
+        # Per-row columns
+        self.row_train = np.array([train_ids[id(row.train)] for row in rows], dtype=np.int64)
+        self.fare = np.array(
+            [np.nan if row.fare_value is None else row.fare_value for row in rows], dtype=np.float64
+        )
+        self.departure = self.train_departure[self.row_train]
+        self.duration = self.train_duration[self.row_train]
+        self.status = np.array([STATUS_CODES.index(row.status_code) for row in rows], dtype=np.int8)
+        # Rows without a className get -1 so no class filter ever matches them
+        self.class_code = np.array([class_ids.get(row.class_name, -1) for row in rows], dtype=np.int64)
+        self.type_mask = self.train_types[self.row_train]
+        self.available = self.status == STATUS_CODES.index(STATUS_AVAILABLE)
+        # The endpoints only list fares upstream actually sent (non-empty and numeric)
+        self.has_fare = np.array([bool(row.fare) for row in rows], dtype=bool) & ~np.isnan(self.fare)
+
+    def type_bits(self, train_types):
+        """Bitmask for a list of train types; types this search never saw contribute nothing"""
+        return sum(1 << self.type_names.index(t) for t in set(train_types) if t in self.type_names)
+
+    def class_mask(self, classes):
+        codes = [self.class_names.index(c) for c in classes if c in self.class_names]
+        return np.isin(self.class_code, codes)
+
+    def filter(self, train_types=None, departure_after=None, departure_before=None, classes=None, only_available=False):
+        """
+        Trains passing the train-level filters, each paired with the rows that pass the class and
+        availability filters. With only_available, trains left without matching rows are dropped.
+        """
+        train_mask = np.ones(len(self.trains), dtype=bool)
+        if train_types:
+            train_mask &= (self.train_types & self.type_bits(train_types)) != 0
+        # NaN compares False, so trains without a departure time drop out of time filters
+        if departure_after is not None:
+            train_mask &= self.train_departure >= departure_after
+        if departure_before is not None:
+            train_mask &= self.train_departure <= departure_before
+
+        row_mask = train_mask[self.row_train]
+        if classes:
+            row_mask &= self.class_mask(classes)
+        if only_available:
+            row_mask &= self.available
+
+        matched = np.flatnonzero(row_mask)
+        counts = np.bincount(self.row_train[matched], minlength=len(self.trains))
+        if only_available:
+            train_mask &= counts > 0
+
+        # Rows are stored in train order, so each train's matches are one contiguous slice
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        return [
+            (self.trains[i], [self.rows[r] for r in matched[offsets[i]:offsets[i + 1]]])
+            for i in np.flatnonzero(train_mask)
+        ]
+
+    def cheapest(self, class_name=None, limit=10):
+        """Available rows with a fare, cheapest first (ties keep search order). Returns (count, rows)"""
+        mask = self.available & self.has_fare
+        if class_name:
+            mask &= self.class_mask([class_name])
+        idx = np.flatnonzero(mask)
+        order = idx[np.argsort(self.fare[idx], kind='stable')]
+        return len(idx), [self.rows[r] for r in order[:limit]]
+
+    def fastest(self, limit=10):
+        """Trains with an available class, shortest duration first. Returns (count, trains)"""
+        idx = np.flatnonzero(self.train_available & ~np.isnan(self.train_duration))
+        order = idx[np.argsort(self.train_duration[idx], kind='stable')]
+        return len(idx), [self.trains[i] for i in order[:limit]]
+
+
+def build_train_index(data):
+    return TrainIndex(data)
+
+
+def merge_search_results(dated_results):
+    """
+    Combine searches of one route on several dates into a single payload.
+    dated_results is a list of (JDATE, search result); each train is tagged with its journeyDate
+    and the top-level fields (quotaList, timeStamp, ...) come from the first search.
+    """
+    merged = {k: v for k, v in dated_results[0][1].items() if k != 'trainBtwnStnsList'}
+    merged['journeyDates'] = [jdate for jdate, _ in dated_results]
+    merged['trainBtwnStnsList'] = [
+        {**train, 'journeyDate': jdate}
+        for jdate, data in dated_results
+        for train in data.get('trainBtwnStnsList', [])
+    ]
+    return merged
+
+
+def merge_station_pairs(pair_results):
+    """
+    Combine searches of several station pairs (one date) into a single payload.
+    pair_results is a list of ((SRC, DST), search result). Upstream also lists trains from nearby
+    stations, so a train found under several pairs is kept once per boarding and destination
+    station, tagged with the first searchPair that listed it.
+    """
+    seen = set()
+    trains = []
+    for pair, data in pair_results:
+        for train in data.get('trainBtwnStnsList', []):
+            identity = (train.get('trainNumber'), train.get('fromStnCode'), train.get('toStnCode'))
+            if identity in seen:
+                continue
+            seen.add(identity)
+            trains.append({**train, 'searchPair': list(pair)})
+
+    merged = {k: v for k, v in pair_results[0][1].items() if k != 'trainBtwnStnsList'}
+    merged['stationPairs'] = [list(pair) for pair, _ in pair_results]
+    merged['trainBtwnStnsList'] = trains
+    return merged